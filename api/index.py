@@ -1,18 +1,210 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 import instaloader
 from instaloader.exceptions import ProfileNotExistsException, LoginRequiredException, PrivateProfileNotFollowedException
 import os
-from typing import List
+import re
+import sys
+import json
+import gzip
+import sqlite3
+import tempfile
+import threading
+import time
+import contextvars
+import cProfile
+import pstats
+import logging
+import random
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import timezone
+from functools import wraps
+from itertools import chain, islice
+from typing import List, Optional, Tuple
 from urllib.parse import urlparse, unquote
 
+try:
+    import brotli  # Optional: enables "br" responses when installed
+except ImportError:
+    brotli = None
+
 import requests
+from requests.adapters import HTTPAdapter
 from fastapi.responses import StreamingResponse
 
+# Helpers shared with the downloaders live in the repository root, which is not on
+# sys.path when this file is run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from post_window import iter_posts_in_window, parse_window_date, validate_window
+
+logger = logging.getLogger("instaloader_api")
+if not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+# Stage timings of the current request; the list is shared with the worker thread
+# that runs a sync endpoint because Starlette copies the context into it.
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+# Where the current request's profile should be written, when it is being profiled
+_request_profile_path = contextvars.ContextVar("request_profile_path", default=None)
+# Profiles of work the profiled request handed to pool threads, merged into its profile file
+_request_thread_profiles = contextvars.ContextVar("request_thread_profiles", default=None)
+
+@contextmanager
+def span(name: str):
+    """Time a stage of the current request for the Server-Timing header and request log"""
+    spans = _request_spans.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if spans is not None:
+            spans.append((name, (time.perf_counter() - started) * 1000))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Upstream '{name}' is unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Fail fast while an upstream is degraded.
+
+    Closed: calls pass and their outcome is kept for window_seconds. Once at least
+    min_calls were seen and the share of failed or slow calls reaches its threshold,
+    the breaker opens. Open: calls are rejected with CircuitOpenError for open_seconds.
+    Half-open: a single probe call is let through; success closes the breaker, a
+    failure or slow call opens it again.
+    """
+
+    def __init__(self, name: str, window_seconds: float = 60, min_calls: int = 5, error_rate: float = 0.5,
+                 slow_call_seconds: float = 10, slow_rate: float = 0.5, open_seconds: float = 30):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.opened_at = None
+        self.trips = 0
+        self.rejected = 0
+        self._calls = deque()  # (finished_at, failed, slow)
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _trip(self, now: float):
+        self.state = "open"
+        self.opened_at = now
+        self.trips += 1
+        self._calls.clear()
+        print(f"Circuit breaker '{self.name}' opened")
+
+    def before_call(self):
+        """Reserve a call, raising CircuitOpenError while the breaker rejects calls"""
+        with self._lock:
+            now = time.time()
+            if self.state == "open":
+                remaining = self.opened_at + self.open_seconds - now
+                if remaining > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.open_seconds)
+                self._probe_in_flight = True
+
+    def record(self, duration: Optional[float], failed: bool):
+        """Record a call outcome; duration None means latency is not judged"""
+        with self._lock:
+            now = time.time()
+            slow = duration is not None and duration >= self.slow_call_seconds
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                if failed or slow:
+                    self._trip(now)
+                else:
+                    self.state = "closed"
+                    self._calls.clear()
+                    print(f"Circuit breaker '{self.name}' closed")
+                return
+            self._calls.append((now, failed, slow))
+            while self._calls and self._calls[0][0] < now - self.window_seconds:
+                self._calls.popleft()
+            total = len(self._calls)
+            if total >= self.min_calls:
+                failures = sum(1 for _, call_failed, _ in self._calls if call_failed)
+                slow_calls = sum(1 for _, _, call_slow in self._calls if call_slow)
+                if failures / total >= self.error_rate or slow_calls / total >= self.slow_rate:
+                    self._trip(now)
+
+    @contextmanager
+    def call(self, timed: bool = True, is_failure=lambda exc: True):
+        """Guard one upstream call; exceptions for which is_failure is false count as successes"""
+        self.before_call()
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as exc:
+            self.record(time.perf_counter() - started if timed else None, is_failure(exc))
+            raise
+        except BaseException:
+            self.record(None, False)  # Interrupted, not an upstream verdict; frees a half-open probe
+            raise
+        else:
+            self.record(time.perf_counter() - started if timed else None, False)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = len(self._calls)
+            return {
+                "state": self.state,
+                "calls_in_window": total,
+                "failure_rate": round(sum(1 for call in self._calls if call[1]) / total, 3) if total else 0.0,
+                "slow_rate": round(sum(1 for call in self._calls if call[2]) / total, 3) if total else 0.0,
+                "trips": self.trips,
+                "rejected": self.rejected,
+                "retry_in": round(max(self.opened_at + self.open_seconds - time.time(), 0), 1) if self.state == "open" else 0,
+            }
+
+def is_upstream_failure(exc: Exception) -> bool:
+    """Definite answers about a profile or bad input say nothing about upstream health"""
+    return not isinstance(exc, (ProfileNotExistsException, PrivateProfileNotFollowedException,
+                                LoginRequiredException, ValueError))
+
+def upstream_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        window_seconds=float(os.environ.get("BREAKER_WINDOW_SECONDS", "60")),
+        min_calls=int(os.environ.get("BREAKER_MIN_CALLS", "5")),
+        error_rate=float(os.environ.get("BREAKER_ERROR_RATE", "0.5")),
+        slow_call_seconds=float(os.environ.get("BREAKER_SLOW_CALL_SECONDS", "10")),
+        slow_rate=float(os.environ.get("BREAKER_SLOW_RATE", "0.5")),
+        open_seconds=float(os.environ.get("BREAKER_OPEN_SECONDS", "30")),
+    )
+
+# One breaker per upstream class
+graphql_breaker = upstream_breaker("graphql")
+html_fallback_breaker = upstream_breaker("html_fallback")
+cdn_breaker = upstream_breaker("cdn")
+
 def get_instaloader_instance():
     """Create an InstaLoader instance and login if credentials are available"""
+    with span("session"):
+        return _create_instaloader_instance()
+
+def _create_instaloader_instance():
     username = os.environ.get("INSTAGRAM_USERNAME")
     password = os.environ.get("INSTAGRAM_PASSWORD")
     
@@ -69,22 +261,234 @@ app.add_middleware(
     allow_credentials=False,
 )
 
+# Opt-in request profiling: a PROFILE_SAMPLE_RATE fraction of requests, plus any request
+# sending "X-Profile: <PROFILE_TOKEN>", is run under cProfile and stored in PROFILE_DIR.
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "instaloader_profiles"))
+
+def should_profile(request: Request) -> bool:
+    if PROFILE_TOKEN and request.headers.get("x-profile") == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+def format_server_timing(spans: list, total_ms: float) -> str:
+    """Sum repeated stages into one Server-Timing metric each, in first-seen order"""
+    totals = {}
+    for name, duration in spans:
+        totals[name] = totals.get(name, 0.0) + duration
+    metrics = [f"{name};dur={duration:.1f}" for name, duration in totals.items()]
+    metrics.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(metrics)
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Report stage timings in a Server-Timing header and a structured log line"""
+    spans = []
+    spans_token = _request_spans.set(spans)
+    profile_path = None
+    if should_profile(request):
+        profile_path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof")
+    profile_token = _request_profile_path.set(profile_path)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _request_spans.reset(spans_token)
+        _request_profile_path.reset(profile_token)
+    total_ms = (time.perf_counter() - started) * 1000
+
+    response.headers["Server-Timing"] = format_server_timing(spans, total_ms)
+    if profile_path and not os.path.exists(profile_path):
+        profile_path = None  # Skipped: another request held the profiler
+    if profile_path:
+        response.headers["X-Profile-Id"] = os.path.basename(profile_path)
+    logger.info(json.dumps({
+        "event": "request",
+        "method": request.method,
+        "path": request.url.path,
+        "status": response.status_code,
+        "total_ms": round(total_ms, 1),
+        "spans": [{"name": name, "ms": round(duration, 1)} for name, duration in spans],
+        "profile": profile_path,
+    }))
+    return response
+
+# Python 3.12+ allows a single active profiler per process, so profiled requests take turns
+_profiler_lock = threading.Lock()
+
+def profiled(endpoint):
+    """
+    Run a sync endpoint under cProfile when the tracing middleware selected the request.
+
+    A request selected while another one is being profiled runs unprofiled.
+    """
+    @wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profile_path = _request_profile_path.get()
+        if not profile_path or not _profiler_lock.acquire(blocking=False):
+            return endpoint(*args, **kwargs)
+        thread_profiles = []
+        thread_profiles_token = _request_thread_profiles.set(thread_profiles)
+        try:
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(endpoint, *args, **kwargs)
+            finally:
+                os.makedirs(PROFILE_DIR, exist_ok=True)
+                stats = pstats.Stats(profiler)
+                for thread_profile in list(thread_profiles):
+                    stats.add(thread_profile)
+                stats.dump_stats(profile_path)
+        finally:
+            _request_thread_profiles.reset(thread_profiles_token)
+            _profiler_lock.release()
+    return wrapper
+
+def run_profiled(fn, *args, **kwargs):
+    """
+    Run fn on a pool thread, adding its calls to the request's profile when the request is profiled.
+
+    From Python 3.12 on, the request's profiler already sees every thread and a second
+    profiler cannot be started, so fn simply runs.
+    """
+    thread_profiles = _request_thread_profiles.get()
+    if thread_profiles is None or sys.version_info >= (3, 12):
+        return fn(*args, **kwargs)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        profiler.create_stats()
+        thread_profiles.append(profiler)
+
 class DownloadRequest(BaseModel):
     target: str  # Instagram username or URL
     download_type: str = "auto"  # "profile", "post", or "auto"
+    since: Optional[str] = None  # Only profile posts taken on or after this ISO 8601 date
+    until: Optional[str] = None  # Only profile posts taken on or before this ISO 8601 date
+    limit: Optional[int] = None  # At most this many of the newest matching profile posts
+    manifest: str = "urls"  # "urls" for a flat URL list, "compact" for the structured manifest
 
 class DownloadResponse(BaseModel):
     status: str
     message: str
     media_urls: List[str]
+    manifest: Optional[dict] = None
+
+# Columns of each compact manifest entry. A URL is rebuilt as the first `shared`
+# characters of the previous entry's URL followed by `suffix`.
+MANIFEST_FIELDS = ["shortcode", "type", "width", "height", "taken_at", "shared", "suffix"]
+
+def build_compact_manifest(media_items: List[dict]) -> dict:
+    """Encode media items as positional entries with shared-prefix (front-coded) URLs"""
+    entries = []
+    previous_url = ""
+    for item in media_items:
+        url = item["url"]
+        shared = len(os.path.commonprefix([previous_url, url]))
+        entries.append([
+            item["shortcode"],
+            item["type"],
+            item["width"],
+            item["height"],
+            item["taken_at"],
+            shared,
+            url[shared:],
+        ])
+        previous_url = url
+    return {"version": 1, "fields": MANIFEST_FIELDS, "entries": entries}
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, honouring q=0 exclusions"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+def compressed_json_response(model: BaseModel, accept_encoding: Optional[str]) -> Response:
+    """Serialize a response model and compress it with the best encoding the client accepts"""
+    with span("serialize"):
+        body = model.model_dump_json(exclude_none=True).encode()
+    headers = {"Vary": "Accept-Encoding"}
+    encoding = negotiate_encoding(accept_encoding) if len(body) >= 1024 else None
+    with span("compress"):
+        if encoding == "br":
+            body = brotli.compress(body, quality=5)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=6)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+class InFlightCalls:
+    """
+    Coalesce identical concurrent calls: the first caller for a key does the work,
+    callers arriving while it runs wait for and share its result or exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def run(self, key, fn, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            with span("coalesced"):
+                return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+# Identical crawls and profile lookups running at the same time share one upstream request
+media_item_calls = InFlightCalls()
+profile_info_calls = InFlightCalls()
 
 @app.get("/")
 def read_root():
     return {"message": "InstaLoader API", "status": "running"}
 
+@app.get("/api/health")
+def health():
+    """Report the state of the upstream circuit breakers"""
+    breakers = {breaker.name: breaker.snapshot() for breaker in (graphql_breaker, html_fallback_breaker, cdn_breaker)}
+    degraded = any(breaker["state"] != "closed" for breaker in breakers.values())
+    return {
+        "status": "degraded" if degraded else "ok",
+        "circuit_breakers": breakers,
+        "coalesced_calls": {"media": media_item_calls.coalesced, "profile_info": profile_info_calls.coalesced},
+    }
+
 @app.post("/api/download", response_model=DownloadResponse)
-def start_download(request: DownloadRequest):
-    """Synchronously resolve the requested media and return the URLs."""
+@profiled
+def start_download(request: DownloadRequest, accept_encoding: Optional[str] = Header(None)):
+    """Synchronously resolve the requested media and return the URLs or a compact manifest."""
+
+    if request.manifest not in ("urls", "compact"):
+        raise HTTPException(status_code=400, detail="Invalid manifest format")
 
     if request.download_type == "auto":
         if "instagram.com/p/" in request.target or "instagram.com/reel/" in request.target:
@@ -95,22 +499,42 @@ def start_download(request: DownloadRequest):
         download_type = request.download_type
 
     try:
+        # The manifest format only changes serialization, so it is not part of the key
         if download_type == "profile":
-            media_urls = get_profile_media_urls(request.target)
+            since = parse_window_date(request.since)
+            until = parse_window_date(request.until, end_of_day=True)
+            media_items = media_item_calls.run(
+                ("profile", request.target.strip().lower(), since, until, request.limit),
+                get_profile_media_items, request.target, since=since, until=until, limit=request.limit,
+            )
         elif download_type == "post":
-            media_urls = get_post_media_urls(request.target)
+            media_items = media_item_calls.run(("post", request.target.strip()), get_post_media_items, request.target)
         else:
             raise HTTPException(status_code=400, detail="Invalid download type")
 
-        if not media_urls:
+        if not media_items:
             raise HTTPException(status_code=404, detail="No media found for the requested target")
 
-        return DownloadResponse(
-            status="completed",
-            message=f"Found {len(media_urls)} media items.",
-            media_urls=media_urls,
-        )
+        if request.manifest == "compact":
+            response = DownloadResponse(
+                status="completed",
+                message=f"Found {len(media_items)} media items.",
+                media_urls=[],
+                manifest=build_compact_manifest(media_items),
+            )
+        else:
+            response = DownloadResponse(
+                status="completed",
+                message=f"Found {len(media_items)} media items.",
+                media_urls=[item["url"] for item in media_items],
+            )
+        return compressed_json_response(response, accept_encoding)
+
+    except HTTPException:
+        raise
 
+    except CircuitOpenError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(int(exc.retry_after) + 1)})
     except ProfileNotExistsException as exc:
         raise HTTPException(status_code=404, detail=str(exc))
     except LoginRequiredException as exc:
@@ -122,25 +546,319 @@ def start_download(request: DownloadRequest):
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {exc}")
 
-def get_profile_media_urls(username: str) -> List[str]:
-    """Get all media URLs from an Instagram profile"""
+def media_item(url: str, shortcode: str, is_video: bool, taken_at, dimensions: Optional[dict] = None) -> dict:
+    """Describe one media file for the download manifest"""
+    dimensions = dimensions or {}
+    return {
+        "url": url,
+        "shortcode": shortcode,
+        "type": "video" if is_video else "image",
+        "width": dimensions.get("width"),
+        "height": dimensions.get("height"),
+        "taken_at": int(taken_at.replace(tzinfo=timezone.utc).timestamp()),
+    }
+
+def post_dimensions(post) -> dict:
+    """Dimensions of a post's main media; instaloader keeps them only in the raw node"""
+    return post._node.get("dimensions") or {}
+
+# Local mirror of crawled profiles. Requests for a profile crawled less than
+# MIRROR_REFRESH_SECONDS ago are answered from the index, topped up with the newest
+# posts at most every MIRROR_TOPUP_SECONDS; older entries trigger a full re-crawl,
+# which also renews the signed CDN URLs before they expire. Set MIRROR_DB_PATH to
+# an empty string to disable the mirror.
+MIRROR_DB_PATH = os.environ.get("MIRROR_DB_PATH", os.path.join(tempfile.gettempdir(), "instaloader_mirror.sqlite3"))
+MIRROR_TOPUP_SECONDS = int(os.environ.get("MIRROR_TOPUP_SECONDS", "300"))
+MIRROR_REFRESH_SECONDS = int(os.environ.get("MIRROR_REFRESH_SECONDS", "43200"))
+
+class MediaMirror:
+    """
+    SQLite index of profiles, posts and media entries populated by every profile crawl.
+
+    A collab post shows up in the feed of each of its authors, so posts are keyed on
+    (username, shortcode); its media rows are shared and kept while any profile lists it.
+    """
+
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # Readers don't wait for crawls writing, and commits skip the fsync of the full journal mode
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+            # The mirror is only a cache; older layouts are dropped and refilled by the next crawls
+            self._db.executescript("DROP TABLE IF EXISTS media; DROP TABLE IF EXISTS posts; DROP TABLE IF EXISTS profiles;")
+            self._db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS profiles (
+                username TEXT PRIMARY KEY,
+                full_crawl_at REAL,
+                checked_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS posts (
+                username TEXT NOT NULL,
+                shortcode TEXT NOT NULL,
+                taken_at INTEGER NOT NULL,
+                is_pinned INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (username, shortcode)
+            );
+            CREATE INDEX IF NOT EXISTS posts_by_profile ON posts (username, taken_at);
+            CREATE INDEX IF NOT EXISTS posts_by_shortcode ON posts (shortcode);
+            CREATE TABLE IF NOT EXISTS media (
+                shortcode TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                type TEXT NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                PRIMARY KEY (shortcode, position)
+            );
+        """)
+
+    def profile_state(self, username: str) -> Optional[tuple]:
+        """Return (full_crawl_at, checked_at) for a mirrored profile, or None"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT full_crawl_at, checked_at FROM profiles WHERE username = ?", (username.lower(),)
+            ).fetchone()
+
+    def has_post(self, username: str, shortcode: str) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM posts WHERE username = ? AND shortcode = ?", (username.lower(), shortcode)
+            ).fetchone() is not None
+
+    def store_posts(self, username: str, posts: List[tuple]):
+        """Insert or replace (is_pinned, media_items) posts of a profile in a single transaction"""
+        if not posts:
+            return
+        shortcodes = [(items[0]["shortcode"],) for _, items in posts]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO posts (username, shortcode, taken_at, is_pinned) VALUES (?, ?, ?, ?)",
+                [(username.lower(), items[0]["shortcode"], items[0]["taken_at"], int(is_pinned))
+                 for is_pinned, items in posts],
+            )
+            self._db.executemany("DELETE FROM media WHERE shortcode = ?", shortcodes)
+            self._db.executemany(
+                "INSERT INTO media (shortcode, position, url, type, width, height) VALUES (?, ?, ?, ?, ?, ?)",
+                [(item["shortcode"], position, item["url"], item["type"], item["width"], item["height"])
+                 for _, items in posts for position, item in enumerate(items)],
+            )
+
+    def mark_crawled(self, username: str, full: bool):
+        """Record a crawl; a full crawl replaces everything previously known about the profile"""
+        now = time.time()
+        with self._lock, self._db:
+            if full:
+                self._db.execute("INSERT OR REPLACE INTO profiles (username, full_crawl_at, checked_at) VALUES (?, ?, ?)",
+                                 (username.lower(), now, now))
+            else:
+                self._db.execute("""
+                    INSERT INTO profiles (username, full_crawl_at, checked_at) VALUES (?, NULL, ?)
+                    ON CONFLICT (username) DO UPDATE SET checked_at = excluded.checked_at
+                """, (username.lower(), now))
+
+    def prune_posts(self, username: str, keep_shortcodes: set):
+        """Drop mirrored posts of a profile that a full crawl no longer returned (deleted upstream)"""
+        with self._lock, self._db:
+            stale = [(shortcode,) for (shortcode,) in self._db.execute(
+                "SELECT shortcode FROM posts WHERE username = ?", (username.lower(),)
+            ) if shortcode not in keep_shortcodes]
+            self._db.executemany("DELETE FROM posts WHERE username = ? AND shortcode = ?",
+                                 [(username.lower(), shortcode) for (shortcode,) in stale])
+            # Media of a collab post stays while another author's feed still lists it
+            self._db.executemany(
+                "DELETE FROM media WHERE shortcode = ? AND NOT EXISTS (SELECT 1 FROM posts WHERE posts.shortcode = media.shortcode)",
+                stale,
+            )
+
+    def media_items(self, username: str, since=None, until=None, limit: Optional[int] = None) -> List[dict]:
+        """Media items of the mirrored posts in the window, newest post first"""
+        query = "SELECT shortcode, taken_at FROM posts WHERE username = ?"
+        params = [username.lower()]
+        if since is not None:
+            query += " AND taken_at >= ?"
+            params.append(int(since.replace(tzinfo=timezone.utc).timestamp()))
+        if until is not None:
+            query += " AND taken_at <= ?"
+            params.append(int(until.replace(tzinfo=timezone.utc).timestamp()))
+        query += " ORDER BY taken_at DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            posts = self._db.execute(query, params).fetchall()
+            items = []
+            for shortcode, taken_at in posts:
+                for url, media_type, width, height in self._db.execute(
+                    "SELECT url, type, width, height FROM media WHERE shortcode = ? ORDER BY position", (shortcode,)
+                ):
+                    items.append({"url": url, "shortcode": shortcode, "type": media_type,
+                                  "width": width, "height": height, "taken_at": taken_at})
+            return items
+
+_media_mirror = None
+_media_mirror_lock = threading.Lock()
+
+def get_media_mirror() -> Optional[MediaMirror]:
+    """Open the shared mirror index on first use; None when the mirror is disabled"""
+    global _media_mirror
+    if not MIRROR_DB_PATH:
+        return None
+    with _media_mirror_lock:
+        if _media_mirror is None:
+            _media_mirror = MediaMirror(MIRROR_DB_PATH)
+        return _media_mirror
+
+def profile_post_media_items(post) -> List[dict]:
+    """Media item of a profile post as listed in the profile feed"""
+    url = post.video_url if post.is_video else post.url
+    return [media_item(url, post.shortcode, post.is_video, post.date_utc, post_dimensions(post))]
+
+# Speculative prefetch: after a successful profile-info lookup the first post pages are
+# warmed in the background, since a download request usually follows. Each warm crawl
+# keeps the fetched posts and the live post iterator so the download resumes paging
+# where the prefetch stopped. PREFETCH_PAGES=0 disables it.
+PREFETCH_PAGES = int(os.environ.get("PREFETCH_PAGES", "1"))
+PREFETCH_PAGE_SIZE = 12
+PREFETCH_TTL_SECONDS = float(os.environ.get("PREFETCH_TTL_SECONDS", "120"))
+PREFETCH_MAX_ENTRIES = int(os.environ.get("PREFETCH_MAX_ENTRIES", "32"))
+PREFETCH_MAX_CONCURRENT = int(os.environ.get("PREFETCH_MAX_CONCURRENT", "2"))
+
+prefetch_pool = ThreadPoolExecutor(max_workers=max(PREFETCH_MAX_CONCURRENT, 1), thread_name_prefix="prefetch")
+warm_crawls = OrderedDict()  # username -> (created_at, posts, post_iterator), oldest first
+prefetches_in_flight = set()
+warm_crawls_lock = threading.Lock()
+
+def schedule_prefetch(profile: instaloader.Profile):
+    """Warm the first post pages of a resolved profile unless the budget is used up or they are already warm"""
+    key = profile.username.lower()
+    if PREFETCH_PAGES <= 0:
+        return
+    mirror = get_media_mirror()
+    state = mirror.profile_state(key) if mirror else None
+    if state and state[0] and time.time() - state[0] < MIRROR_REFRESH_SECONDS:
+        return  # The mirror already answers this profile without a crawl
+    with warm_crawls_lock:
+        if key in warm_crawls or key in prefetches_in_flight or len(prefetches_in_flight) >= PREFETCH_MAX_CONCURRENT:
+            return
+        prefetches_in_flight.add(key)
+    prefetch_pool.submit(prefetch_posts, key, profile)
+
+def prefetch_posts(username: str, profile: instaloader.Profile):
     try:
-        loader = get_instaloader_instance()
+        post_iterator = profile.get_posts()
+        with graphql_breaker.call(timed=False, is_failure=is_upstream_failure):
+            posts = list(islice(post_iterator, PREFETCH_PAGES * PREFETCH_PAGE_SIZE))
+        with warm_crawls_lock:
+            warm_crawls[username] = (time.time(), posts, post_iterator)
+            warm_crawls.move_to_end(username)
+            while len(warm_crawls) > PREFETCH_MAX_ENTRIES:
+                warm_crawls.popitem(last=False)
+    except Exception as e:
+        print(f"Prefetch failed for {username}: {e}")
+    finally:
+        with warm_crawls_lock:
+            prefetches_in_flight.discard(username)
+
+def take_warm_crawl(username: str):
+    """Remove and return (posts, post_iterator) of a fresh warm crawl, or None"""
+    with warm_crawls_lock:
+        entry = warm_crawls.pop(username.lower(), None)
+    if entry is None or time.time() - entry[0] > PREFETCH_TTL_SECONDS:
+        return None
+    return entry[1], entry[2]
+
+def iter_profile_posts(username: str):
+    """Posts of a profile newest-first, starting from prefetched pages when they are warm"""
+    warm = take_warm_crawl(username)
+    if warm is not None:
+        with span("prefetch_hit"):
+            posts, post_iterator = warm
+        return chain(posts, post_iterator)
+
+    loader = get_instaloader_instance()
+    with span("profile"), graphql_breaker.call(is_failure=is_upstream_failure):
         profile = instaloader.Profile.from_username(loader.context, username)
+    return profile.get_posts()
+
+def top_up_mirror(mirror: MediaMirror, username: str):
+    """Fetch posts newer than the newest mirrored one; usually a single page"""
+    posts = iter_profile_posts(username)
+    pending = []
+    # Paging time grows with the profile, so only its errors are judged
+    with span("graphql_paging"), graphql_breaker.call(timed=False, is_failure=is_upstream_failure):
+        try:
+            for post in posts:
+                is_pinned = getattr(post, "is_pinned", False)
+                if not is_pinned and mirror.has_post(username, post.shortcode):
+                    break
+                pending.append((is_pinned, profile_post_media_items(post)))
+                if len(pending) >= PREFETCH_PAGE_SIZE:
+                    mirror.store_posts(username, pending)
+                    pending = []
+        finally:
+            mirror.store_posts(username, pending)
+    mirror.mark_crawled(username, full=False)
+
+def get_profile_media_items(username: str, since=None, until=None, limit: Optional[int] = None) -> List[dict]:
+    """Get media items from an Instagram profile, stopping once the crawl passes the since/until/limit window"""
+    try:
+        validate_window(since, until, limit)
+
+        mirror = get_media_mirror()
+        state = mirror.profile_state(username) if mirror else None
+        full_crawl_at, checked_at = state or (None, None)
+        if full_crawl_at and time.time() - full_crawl_at < MIRROR_REFRESH_SECONDS:
+            if time.time() - checked_at >= MIRROR_TOPUP_SECONDS:
+                try:
+                    top_up_mirror(mirror, username)
+                except Exception as e:
+                    # A stale-but-complete index is still a better answer than an error
+                    print(f"Mirror top-up failed for {username}, serving indexed media: {e}")
+            with span("mirror"):
+                return mirror.media_items(username, since, until, limit)
+
+        posts = iter_profile_posts(username)
         
-        urls = []
-        for post in profile.get_posts():
-            if post.is_video:
-                urls.append(post.video_url)
-            else:
-                urls.append(post.url)
-        return urls
+        items = []
+        pending = []
+        # Paging time grows with the profile, so only its errors are judged
+        with span("graphql_paging"), graphql_breaker.call(timed=False, is_failure=is_upstream_failure):
+            try:
+                for post in iter_posts_in_window(posts, since, until, limit):
+                    post_items = profile_post_media_items(post)
+                    items.extend(post_items)
+                    if mirror:
+                        # Written one GraphQL page at a time, in one transaction each
+                        pending.append((getattr(post, "is_pinned", False), post_items))
+                        if len(pending) >= PREFETCH_PAGE_SIZE:
+                            mirror.store_posts(username, pending)
+                            pending = []
+            finally:
+                if mirror:
+                    mirror.store_posts(username, pending)
+        if mirror:
+            # Only an unwindowed crawl has seen every post of the profile
+            full = since is None and until is None and limit is None
+            if full:
+                mirror.prune_posts(username, {item["shortcode"] for item in items})
+            mirror.mark_crawled(username, full=full)
+        return items
     except Exception as e:
         print(f"Error fetching profile media for {username}: {e}")
         raise e
 
-def get_post_media_urls(url: str) -> List[str]:
-    """Get media URL(s) from a single Instagram post"""
+def get_profile_media_urls(username: str, since=None, until=None, limit: Optional[int] = None) -> List[str]:
+    """Get media URLs from an Instagram profile, stopping once the crawl passes the since/until/limit window"""
+    return [item["url"] for item in get_profile_media_items(username, since, until, limit)]
+
+def get_post_media_items(url: str) -> List[dict]:
+    """Get media item(s) from a single Instagram post"""
     try:
         loader = get_instaloader_instance()
         
@@ -151,31 +869,54 @@ def get_post_media_urls(url: str) -> List[str]:
         else:
             raise ValueError("Invalid Instagram URL")
             
-        post = instaloader.Post.from_shortcode(loader.context, shortcode)
+        with span("post"), graphql_breaker.call(is_failure=is_upstream_failure):
+            post = instaloader.Post.from_shortcode(loader.context, shortcode)
         
-        urls = []
+        items = []
         if post.is_video:
-            urls.append(post.video_url)
+            items.append(media_item(post.video_url, shortcode, True, post.date_utc, post_dimensions(post)))
         else:
             # Handle sidecars (carousels)
             if post.typename == 'GraphImage':
-                urls.append(post.url)
+                items.append(media_item(post.url, shortcode, False, post.date_utc, post_dimensions(post)))
             elif post.typename == 'GraphSidecar':
-                for node in post.get_sidecar_nodes():
-                    if node.is_video:
-                        urls.append(node.video_url)
-                    else:
-                        urls.append(node.display_url)
-        return urls
+                with span("sidecar"):
+                    for node in post.get_sidecar_nodes():
+                        if node.is_video:
+                            items.append(media_item(node.video_url, shortcode, True, post.date_utc))
+                        else:
+                            items.append(media_item(node.display_url, shortcode, False, post.date_utc))
+        return items
     except Exception as e:
         print(f"Error fetching post media for {url}: {e}")
         raise e
 
-import re
-import json
+def get_post_media_urls(url: str) -> List[str]:
+    """Get media URL(s) from a single Instagram post"""
+    return [item["url"] for item in get_post_media_items(url)]
+
+# Pooled HTTP client for the HTML fallback, so lookups reuse warm TLS connections
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+
+# How long the Instaloader lookup runs alone before the HTML fallback is raced against it
+PROFILE_HEDGE_DELAY = float(os.environ.get("PROFILE_HEDGE_DELAY", "1.5"))
+profile_lookup_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("PROFILE_LOOKUP_WORKERS", "16")),
+                                         thread_name_prefix="profile-lookup")
+# Separate from the lookup pool, so Instaloader lookups stuck on a slow upstream never delay a hedge
+profile_fallback_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("PROFILE_FALLBACK_WORKERS", "16")),
+                                           thread_name_prefix="profile-fallback")
+
+SHARED_DATA_START = b'window._sharedData = '
+SHARED_DATA_END = b';</script>'
 
-def get_instagram_profile_via_api(username: str):
-    """Fallback function to get profile info using Instagram's web API"""
+def get_instagram_profile_via_api(username: str, cancelled: Optional[threading.Event] = None):
+    """
+    Fallback function to get profile info using Instagram's web API.
+
+    The page is streamed only until the embedded JSON has been read, and reading
+    stops early once cancelled is set.
+    """
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -185,62 +926,150 @@ def get_instagram_profile_via_api(username: str):
     }
     
     try:
-        response = requests.get(f'https://www.instagram.com/{username}/', headers=headers)
-        if response.status_code == 200:
-            # Extract JSON data from the page
-            text = response.text
-            start = text.find('window._sharedData = ') + len('window._sharedData = ')
-            end = text.find(';</script>', start)
-            json_str = text[start:end]
-            data = json.loads(json_str)
-            
-            user_data = data['entry_data']['ProfilePage'][0]['graphql']['user']
-            
-            return {
-                "username": user_data['username'],
-                "full_name": user_data['full_name'],
-                "followers": user_data['edge_followed_by']['count'],
-                "posts": user_data['edge_owner_to_timeline_media']['count'],
-                "biography": user_data['biography'],
-                "is_private": user_data['is_private']
-            }
-        else:
+        with span("html_fallback"):
+            with html_fallback_breaker.call():
+                response = http_session.get(f'https://www.instagram.com/{username}/', headers=headers,
+                                            stream=True, timeout=10)
+                if response.status_code == 429 or response.status_code >= 500:
+                    response.close()
+                    raise requests.HTTPError(f"Fallback page returned {response.status_code}")
+            try:
+                if response.status_code != 200:
+                    return None
+                json_bytes = read_shared_data(response, cancelled)
+            finally:
+                response.close()
+        if json_bytes is None:
             return None
+
+        with span("html_parse"):
+            data = json.loads(json_bytes)
+        
+        user_data = data['entry_data']['ProfilePage'][0]['graphql']['user']
+        
+        return {
+            "username": user_data['username'],
+            "full_name": user_data['full_name'],
+            "followers": user_data['edge_followed_by']['count'],
+            "posts": user_data['edge_owner_to_timeline_media']['count'],
+            "biography": user_data['biography'],
+            "is_private": user_data['is_private']
+        }
     except Exception as e:
         print(f"Error in fallback API for {username}: {e}")
         return None
 
+def read_shared_data(response, cancelled: Optional[threading.Event] = None) -> Optional[bytes]:
+    """Read a streamed profile page just far enough to return the window._sharedData JSON"""
+    buffer = b""
+    in_json = False
+    for chunk in response.iter_content(chunk_size=16384):
+        if cancelled is not None and cancelled.is_set():
+            return None
+        # A marker may straddle two chunks, so each search resumes one marker length back
+        marker = SHARED_DATA_END if in_json else SHARED_DATA_START
+        search_from = max(len(buffer) - len(marker), 0)
+        buffer += chunk
+        if not in_json:
+            found = buffer.find(SHARED_DATA_START, search_from)
+            if found < 0:
+                # Only the tail can still hold the start of the marker; drop the rest of the page
+                buffer = buffer[-len(SHARED_DATA_START):]
+                continue
+            buffer = buffer[found + len(SHARED_DATA_START):]
+            in_json = True
+            search_from = 0
+        end = buffer.find(SHARED_DATA_END, search_from)
+        if end >= 0:
+            return buffer[:end]
+    return None
+
+def lookup_profile_info(username: str) -> Tuple[dict, instaloader.Profile]:
+    """Look the profile up through Instaloader; returns (info, profile) and raises Instaloader exceptions"""
+    loader = get_instaloader_instance()
+    with span("profile"), graphql_breaker.call(is_failure=is_upstream_failure):
+        profile = instaloader.Profile.from_username(loader.context, username)
+    
+    return {
+        "username": profile.username,
+        "full_name": profile.full_name,
+        "followers": profile.followers,
+        "posts": profile.mediacount,
+        "biography": profile.biography,
+        "is_private": profile.is_private
+    }, profile
+
+def resolve_profile_info(username: str) -> Tuple[dict, Optional[instaloader.Profile]]:
+    """
+    Resolve profile info by racing Instaloader against the HTML fallback.
+
+    The fallback starts once Instaloader has failed or has taken PROFILE_HEDGE_DELAY
+    seconds; the first valid answer wins. The two paths run in separate pools, so a
+    backlog of slow Instaloader lookups cannot hold the fallback back. A losing fallback
+    stops reading its page, a losing Instaloader lookup finishes in the background and
+    is ignored, or is dropped if it had not started yet.
+    Returns (info, profile); profile is None when the fallback answered.
+    Definite answers (profile missing or private) from Instaloader are raised as is;
+    when both paths fail, Instaloader's exception is raised.
+    """
+    cancelled = threading.Event()
+    primary = profile_lookup_pool.submit(contextvars.copy_context().run, run_profiled, lookup_profile_info, username)
+    fallback = None
+    primary_error = None
+
+    def start_fallback():
+        return profile_fallback_pool.submit(contextvars.copy_context().run, run_profiled,
+                                            get_instagram_profile_via_api, username, cancelled)
+
+    pending = {primary}
+    if not wait(pending, timeout=PROFILE_HEDGE_DELAY).done:
+        fallback = start_fallback()
+        pending.add(fallback)
+
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if primary in done:
+                try:
+                    return primary.result()
+                except (ProfileNotExistsException, PrivateProfileNotFollowedException):
+                    raise
+                except Exception as e:
+                    print(f"Error fetching profile info for {username}: {e}")
+                    primary_error = e
+                    if fallback is None:
+                        fallback = start_fallback()
+                        pending.add(fallback)
+            if fallback is not None and fallback in done:
+                result = fallback.result()
+                if result:
+                    return result, None
+        raise primary_error
+    finally:
+        cancelled.set()
+        # A lookup still queued behind stuck ones is dropped once the fallback has answered
+        primary.cancel()
+        if fallback is not None:
+            fallback.cancel()
+
 @app.get("/api/profile-info/{username}")
+@profiled
 def get_profile_info(username: str):
     try:
-        loader = get_instaloader_instance()
-        profile = instaloader.Profile.from_username(loader.context, username)
-        
-        return {
-            "username": profile.username,
-            "full_name": profile.full_name,
-            "followers": profile.followers,
-            "posts": profile.mediacount,
-            "biography": profile.biography,
-            "is_private": profile.is_private
-        }
+        profile_info, profile = profile_info_calls.run(username.lower(), resolve_profile_info, username)
+        # Only an Instaloader answer carries a Profile the prefetch can page from
+        if profile is not None and not profile_info["is_private"]:
+            schedule_prefetch(profile)
+        return profile_info
     except instaloader.exceptions.ProfileNotExistsException:
         raise HTTPException(status_code=404, detail=f"Profile {username} does not exist")
     except instaloader.exceptions.LoginRequiredException:
-        # Try the fallback API
-        fallback_data = get_instagram_profile_via_api(username)
-        if fallback_data:
-            return fallback_data
-        else:
-            raise HTTPException(status_code=401, detail="Login required to access this profile")
+        raise HTTPException(status_code=401, detail="Login required to access this profile")
     except instaloader.exceptions.PrivateProfileNotFollowedException:
         raise HTTPException(status_code=403, detail=f"Profile {username} is private and not followed")
+    except CircuitOpenError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(int(exc.retry_after) + 1)})
     except Exception as e:
-        print(f"Error fetching profile info for {username}: {e}")
-        # Try the fallback API for other exceptions as well
-        fallback_data = get_instagram_profile_via_api(username)
-        if fallback_data:
-            return fallback_data
         # Provide more informative error handling for API changes
         if "401" in str(e) or "login" in str(e).lower():
             raise HTTPException(status_code=401, detail="Authentication failed. Instagram may have updated their authentication methods.")
@@ -255,6 +1084,7 @@ if __name__ == "__main__":
 
 
 @app.get("/api/proxy")
+@profiled
 def proxy_instagram_media(url: str):
     """Stream Instagram media through the API to avoid CORS issues in the browser."""
 
@@ -278,7 +1108,15 @@ def proxy_instagram_media(url: str):
     }
 
     try:
-        upstream = requests.get(url, headers=headers, stream=True, timeout=30)
+        with span("cdn"), cdn_breaker.call():
+            upstream = requests.get(url, headers=headers, stream=True, timeout=30)
+            if upstream.status_code == 429 or upstream.status_code >= 500:
+                upstream.close()
+                raise requests.HTTPError(f"Upstream responded with {upstream.status_code}", response=upstream)
+    except CircuitOpenError as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(int(exc.retry_after) + 1)})
+    except requests.HTTPError as exc:
+        raise HTTPException(status_code=exc.response.status_code, detail="Upstream responded with an error")
     except requests.RequestException as exc:
         raise HTTPException(status_code=502, detail=f"Failed to reach upstream: {exc}")
 
@@ -0,0 +1,272 @@
+"""
+Archive-backed storage for downloaded profiles.
+
+Instead of leaving thousands of small files under ./downloads/<username>, each
+downloaded file is appended to ./downloads/<username>.zip (or .tar) right after
+its post is downloaded and then removed from disk. A JSON index written next to
+the archive records where every member lives, so single files can be read back
+without scanning the archive.
+
+New members are appended in place. Appending overwrites the archive's tail
+(the zip central directory, or the tar end-of-archive blocks), so that tail is
+saved to "<archive>.journal" first; if a run is killed before the archive is
+finalized, the next run restores the tail and the archive is back to its state
+before the interrupted run, without ever copying the archive itself.
+"""
+
+import base64
+import json
+import os
+import tarfile
+import time
+import zipfile
+
+ARCHIVE_FORMATS = ('zip', 'tar')
+CHUNK_SIZE = 256 * 1024
+
+# Media and .xz sidecars are already compressed; deflating them only costs CPU
+_COMPRESSIBLE_EXTENSIONS = ('.txt', '.json')
+
+
+def archive_path_for(directory, archive_format):
+    """Path of the archive that replaces a profile download directory"""
+    return f"{directory.rstrip('/')}.{archive_format}"
+
+
+def index_path_for(archive_path):
+    return f"{archive_path}.index.json"
+
+
+def journal_path_for(archive_path):
+    """Saved tail of an archive that is being appended to"""
+    return f"{archive_path}.journal"
+
+
+def read_archive_members(archive_path, archive_format):
+    """
+    Return (members, tail_offset) for an archive; raises if it is unreadable.
+
+    members maps names to index entries; appending starts overwriting at tail_offset.
+    """
+    members = {}
+    if archive_format == 'zip':
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                members[info.filename] = {'size': info.file_size, 'offset': info.header_offset,
+                                          'mtime': int(time.mktime(info.date_time + (0, 0, -1)))}
+            tail_offset = archive.start_dir
+    else:
+        with tarfile.open(archive_path) as archive:
+            for info in archive:
+                if info.isfile():
+                    members[info.name] = {'size': info.size, 'offset': info.offset_data, 'mtime': int(info.mtime)}
+            tail_offset = archive.offset
+    return members, tail_offset
+
+
+def _write_journal(archive_path, tail_offset):
+    """Save the tail that appending will overwrite; an archive that does not exist yet has none"""
+    tail = b''
+    if os.path.exists(archive_path):
+        with open(archive_path, 'rb') as f:
+            f.seek(tail_offset)
+            tail = f.read()
+    journal_path = journal_path_for(archive_path)
+    with open(f"{journal_path}.tmp", 'w') as f:
+        json.dump({'offset': tail_offset, 'tail': base64.b64encode(tail).decode()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{journal_path}.tmp", journal_path)
+
+
+def recover_archive(archive_path):
+    """Undo the appends of a run that was killed before finalizing the archive; True if anything was undone"""
+    journal_path = journal_path_for(archive_path)
+    if not os.path.exists(journal_path):
+        return False
+    with open(journal_path) as f:
+        journal = json.load(f)
+    if journal['offset'] == 0 and not journal['tail']:
+        # The interrupted run created the archive; there is nothing to go back to
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+    elif os.path.exists(archive_path):
+        with open(archive_path, 'r+b') as f:
+            f.truncate(journal['offset'])
+            f.seek(journal['offset'])
+            f.write(base64.b64decode(journal['tail']))
+            f.flush()
+            os.fsync(f.fileno())
+    os.remove(journal_path)
+    return True
+
+
+class ProfileArchive:
+    """
+    Append-only zip or tar archive for one profile, fed from its download directory.
+
+    Use as a context manager; the archive is finalized and the index written on exit.
+    """
+
+    def __init__(self, directory, archive_format='zip'):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+        self.directory = directory
+        self.archive_format = archive_format
+        self.path = archive_path_for(directory, archive_format)
+        self.index_path = index_path_for(self.path)
+        self.journal_path = journal_path_for(self.path)
+        self.index = {}
+        self._archive = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        """
+        Open the archive for appending, keeping the members of earlier runs.
+
+        An interrupted earlier run is rolled back first. The index is rebuilt from the
+        members the archive really holds, so files that never got into the archive are
+        downloaded and stored again. An archive that cannot be read is set aside as
+        "<archive>.corrupt".
+        """
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if recover_archive(self.path):
+            print(f"Rolled {self.path} back to its state before an interrupted run")
+        self.index = {}
+        if os.path.exists(self.path):
+            try:
+                self.index, tail_offset = read_archive_members(self.path, self.archive_format)
+                _write_journal(self.path, tail_offset)
+            except (zipfile.BadZipFile, tarfile.TarError, OSError) as e:
+                print(f"Archive {self.path} is unreadable ({e}), moving it aside and starting a new one")
+                os.replace(self.path, f"{self.path}.corrupt")
+        if not os.path.exists(self.path):
+            _write_journal(self.path, 0)
+
+        if self.archive_format == 'zip':
+            self._archive = zipfile.ZipFile(self.path, 'a')
+        else:
+            self._archive = tarfile.open(self.path, 'a')
+
+    def contains(self, file_path):
+        """True if a file of the download directory is already stored in the archive"""
+        arcname = os.path.relpath(file_path, self.directory).replace(os.sep, '/')
+        return arcname in self.index
+
+    def add_file(self, file_path, arcname):
+        """Append one file to the archive and record it in the index; returns its size"""
+        size = os.path.getsize(file_path)
+        if self.archive_format == 'zip':
+            compression = zipfile.ZIP_DEFLATED if arcname.endswith(_COMPRESSIBLE_EXTENSIONS) else zipfile.ZIP_STORED
+            self._archive.write(file_path, arcname, compress_type=compression)
+            info = self._archive.getinfo(arcname)
+            offset = info.header_offset
+        else:
+            info = self._archive.gettarinfo(file_path, arcname)
+            with open(file_path, 'rb') as f:
+                self._archive.addfile(info, f)
+            # Member data ends where the archive now stands, padded to whole tar blocks
+            padded_size = -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            offset = self._archive.offset - padded_size
+        self.index[arcname] = {'size': size, 'offset': offset, 'mtime': int(os.path.getmtime(file_path))}
+        return size
+
+    def absorb(self):
+        """
+        Move every file currently in the download directory into the archive.
+
+        Files already archived by an earlier run are dropped instead of being stored twice;
+        unfinished .part transfers are left in place.
+        Returns (files_added, bytes_added).
+        """
+        files_added = 0
+        bytes_added = 0
+        if not os.path.isdir(self.directory):
+            return files_added, bytes_added
+        for root, dirs, files in os.walk(self.directory):
+            for name in sorted(files):
+                if name.endswith('.part'):
+                    continue  # Unfinished transfer, kept on disk so it can be resumed
+                file_path = os.path.join(root, name)
+                arcname = os.path.relpath(file_path, self.directory).replace(os.sep, '/')
+                if arcname not in self.index:
+                    bytes_added += self.add_file(file_path, arcname)
+                    files_added += 1
+                os.remove(file_path)
+        return files_added, bytes_added
+
+    def close(self):
+        """Finalize the archive, write the index and remove the emptied download directory"""
+        if self._archive is None:
+            return
+        self._archive.close()
+        self._archive = None
+        with open(self.path, 'rb') as f:
+            os.fsync(f.fileno())
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+        temp_path = f"{self.index_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'format': self.archive_format, 'archive': os.path.basename(self.path),
+                       'files': self.index}, f)
+        os.replace(temp_path, self.index_path)
+
+        for root, dirs, files in os.walk(self.directory, topdown=False):
+            try:
+                os.rmdir(root)
+            except OSError:
+                pass  # Not empty, e.g. files written after the last absorb()
+
+
+def open_archived_file(archive_path, name, chunk_size=CHUNK_SIZE):
+    """
+    Open one member of a profile archive for streaming, seeking straight to it through the index.
+
+    Returns (size, chunks). Missing members and unreadable archives raise here, before the
+    first chunk; the archive is closed once chunks is exhausted or closed.
+    """
+    with open(index_path_for(archive_path)) as f:
+        index = json.load(f)
+    entry = index['files'].get(name)
+    if entry is None:
+        raise KeyError(name)
+
+    def read_chunks():
+        if index['format'] == 'tar':
+            with open(archive_path, 'rb') as f:
+                f.seek(entry['offset'])
+                remaining = entry['size']
+                yield
+                while remaining > 0:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        raise tarfile.ReadError(f"{archive_path} ends inside {name}")
+                    remaining -= len(chunk)
+                    yield chunk
+        else:
+            with zipfile.ZipFile(archive_path) as archive, archive.open(name) as member:
+                yield
+                yield from iter(lambda: member.read(chunk_size), b'')
+
+    chunks = read_chunks()
+    next(chunks)  # Opens the archive, so its errors reach the caller now
+    return entry['size'], chunks
+
+
+def read_archived_file(archive_path, name):
+    """Read one member of a profile archive, seeking straight to it through the index"""
+    size, chunks = open_archived_file(archive_path, name)
+    return b''.join(chunks)
+
+
+def add_storage_arguments(parser):
+    """Add the --archive option shared by the command line downloaders"""
+    parser.add_argument('--archive', choices=ARCHIVE_FORMATS, default=None,
+                        help="append downloads to ./downloads/<username>.zip or .tar instead of keeping loose files")
@@ -0,0 +1,150 @@
+"""
+Batch mode for the command line downloaders.
+
+Reads many target usernames, downloads them with a pool of worker threads that
+share one logged-in Instaloader session, and writes a JSON summary with the
+timing and outcome of every target.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import instaloader
+
+from media_transfer import ResumableInstaloader
+from profile_download import download_profile_posts
+
+
+class SharedRateController(instaloader.RateController):
+    """
+    RateController that worker threads can share.
+
+    Instaloader tracks its per-account query budget in plain lists, so concurrent
+    workers are serialized here; a worker sleeping for the budget holds the others
+    back, which is exactly the per-account limit the session must respect.
+    """
+
+    def __init__(self, context):
+        super().__init__(context)
+        self._lock = threading.Lock()
+
+    def wait_before_query(self, query_type):
+        with self._lock:
+            super().wait_before_query(query_type)
+
+    def handle_429(self, query_type):
+        with self._lock:
+            super().handle_429(query_type)
+
+
+def create_batch_loader():
+    """Create an Instaloader whose session and rate limits can be shared by batch workers"""
+    return ResumableInstaloader(
+        dirname_pattern='./downloads/{target}',
+        save_metadata=False,
+        post_metadata_txt_pattern='',
+        rate_controller=SharedRateController,
+    )
+
+
+def load_batch_session(loader, session_file, login_username=None):
+    """
+    Load a saved session into a batch loader once, for all workers to share.
+
+    When the account name is not given it is looked up from the session itself.
+    """
+    loader.load_session_from_file(login_username or 'session', session_file)
+    if not login_username:
+        login_username = loader.test_login()
+        if not login_username:
+            raise instaloader.exceptions.LoginRequiredException(f"Session file {session_file} is not logged in")
+        loader.context.username = login_username
+    return login_username
+
+
+def read_targets(source):
+    """
+    Read target usernames from a file, or from stdin when source is "-".
+
+    Blank lines and lines starting with "#" are skipped, duplicates are dropped.
+    """
+    if source == '-':
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source) as f:
+            lines = f.read().splitlines()
+
+    targets = []
+    for line in lines:
+        target = line.strip()
+        if target and not target.startswith('#') and target not in targets:
+            targets.append(target)
+    return targets
+
+
+def _download_target(loader, target, window):
+    started = time.time()
+    result = {'target': target, 'ok': False, 'posts': 0, 'seconds': None, 'error': None}
+    try:
+        result['posts'] = download_profile_posts(loader, target, **window)
+        result['ok'] = True
+        print(f"[{target}] downloaded {result['posts']} posts")
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        print(f"[{target}] failed: {result['error']}")
+    result['seconds'] = round(time.time() - started, 2)
+    return result
+
+
+def run_batch(loader, targets, workers=4, summary_path=None, since=None, until=None, limit=None, archive_format=None):
+    """
+    Download every target with a pool of workers sharing loader, then write the summary.
+
+    Returns the summary dict; it is also written as JSON to summary_path ("-" for stdout).
+    """
+    window = {'since': since, 'until': until, 'limit': limit, 'archive_format': archive_format}
+    started_at = datetime.now()
+    started = time.time()
+
+    print(f"Downloading {len(targets)} profiles with {workers} workers...")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lambda target: _download_target(loader, target, window), targets))
+
+    failed = [result for result in results if not result['ok']]
+    summary = {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'finished_at': datetime.now().isoformat(timespec='seconds'),
+        'seconds': round(time.time() - started, 2),
+        'workers': workers,
+        'targets': len(targets),
+        'succeeded': len(results) - len(failed),
+        'failed': len(failed),
+        'posts': sum(result['posts'] for result in results),
+        'results': results,
+    }
+
+    if summary_path is None:
+        summary_path = f"./downloads/batch_summary_{started_at.strftime('%Y%m%d-%H%M%S')}.json"
+    if summary_path == '-':
+        print(json.dumps(summary, indent=2))
+    else:
+        os.makedirs(os.path.dirname(summary_path) or '.', exist_ok=True)
+        with open(summary_path, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Batch finished: {summary['succeeded']} succeeded, {summary['failed']} failed. Summary: {summary_path}")
+    return summary
+
+
+def add_batch_arguments(parser):
+    """Add the --batch/--workers/--summary options shared by the command line downloaders"""
+    parser.add_argument('--batch', metavar='FILE', default=None,
+                        help='download every username listed in FILE (one per line, "-" for stdin)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of profiles downloaded in parallel in batch mode (default: 4)')
+    parser.add_argument('--summary', metavar='PATH', default=None,
+                        help='where to write the JSON batch summary ("-" for stdout)')
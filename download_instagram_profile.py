@@ -1,26 +1,30 @@
 import os
 import instaloader
+import argparse
 import sys
 
-def download_profile(username):
+from archive_storage import add_storage_arguments
+from batch_download import add_batch_arguments, create_batch_loader, read_targets, run_batch
+from media_transfer import ResumableInstaloader
+from profile_download import add_window_arguments, download_profile_posts
+
+def download_profile(username, since=None, until=None, limit=None, archive_format=None):
     """
-    Download all media from an Instagram profile
+    Download all media from an Instagram profile, optionally limited to a date range or post count
     """
     print(f"Starting download of profile: {username}")
     
     # Create an Instaloader instance
-    loader = instaloader.Instaloader()
+    loader = ResumableInstaloader()
     loader.save_metadata = False
     loader.post_metadata_txt_pattern = ""
     loader.dirname_pattern = f"./downloads/{username}"  # Download to local directory
     
     try:
         # Download the profile
-        loader.download_profile(username, profile_pic=True, profile_pic_only=False)
+        posts_count = download_profile_posts(loader, username, since=since, until=until, limit=limit,
+                                             archive_format=archive_format)
         print(f"Download of profile {username} completed successfully!")
-        
-        # Count the posts
-        posts_count = loader.download_post_count
         print(f"Downloaded {posts_count} posts")
         
     except instaloader.exceptions.ProfileNotExistsException:
@@ -37,20 +41,34 @@ def get_post_count(username):
     try:
         L = instaloader.Instaloader()
         profile = instaloader.Profile.from_username(L.context, username)
-        posts = profile.get_posts()
-        count = sum(1 for _ in posts)  # Count all posts
-        return count
+        # The profile metadata already carries the total, no need to page through every post
+        return profile.mediacount
     except Exception as e:
         print(f"Error getting post count: {str(e)}")
         return 0
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 download_instagram_profile.py <username>")
-        print("Example: python3 download_instagram_profile.py alvelalucas")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Download media from an Instagram profile",
+        epilog="Example: python3 download_instagram_profile.py alvelalucas --since 2024-01-01 --limit 50\n"
+               "Batch:   python3 download_instagram_profile.py --batch targets.txt --workers 4",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("username", nargs="?", help="Instagram profile to download")
+    add_window_arguments(parser)
+    add_storage_arguments(parser)
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+    
+    if args.batch:
+        summary = run_batch(create_batch_loader(), read_targets(args.batch), workers=args.workers,
+                            summary_path=args.summary, since=args.since, until=args.until, limit=args.limit,
+                            archive_format=args.archive)
+        sys.exit(1 if summary['failed'] else 0)
+    if not args.username:
+        parser.error("a username is required unless --batch is given")
     
-    username = sys.argv[1]
+    username = args.username
     
     # Create downloads directory
     os.makedirs(f"./downloads/{username}", exist_ok=True)
@@ -60,4 +78,4 @@ if __name__ == "__main__":
     print(f"Found {post_count} posts for {username}")
     
     print(f"Starting download for {username}...")
-    download_profile(username)
\ No newline at end of file
+    download_profile(username, since=args.since, until=args.until, limit=args.limit, archive_format=args.archive)
\ No newline at end of file
@@ -1,15 +1,22 @@
 import os
 import instaloader
+import argparse
 import sys
 
-def download_profile_with_login(username, username_login=None, password=None):
+from archive_storage import add_storage_arguments
+from batch_download import add_batch_arguments, create_batch_loader, load_batch_session, read_targets, run_batch
+from media_transfer import ResumableInstaloader
+from profile_download import add_window_arguments, download_profile_posts
+
+def download_profile_with_login(username, username_login=None, password=None, since=None, until=None, limit=None, archive_format=None):
     """
-    Download all media from an Instagram profile using login credentials if needed
+    Download all media from an Instagram profile using login credentials if needed,
+    optionally limited to a date range or post count
     """
     print(f"Starting download of profile: {username}")
     
     # Create an Instaloader instance
-    loader = instaloader.Instaloader()
+    loader = ResumableInstaloader()
     loader.save_metadata = False
     loader.post_metadata_txt_pattern = ""
     loader.dirname_pattern = f"./downloads/{username}"  # Download to local directory
@@ -25,8 +32,9 @@ def download_profile_with_login(username, username_login=None, password=None):
     
     try:
         # Download the profile
-        loader.download_profile(username, profile_pic=True, profile_pic_only=False)
-        print(f"Download of profile {username} completed successfully!")
+        posts_count = download_profile_posts(loader, username, since=since, until=until, limit=limit,
+                                             archive_format=archive_format)
+        print(f"Download of profile {username} completed successfully! ({posts_count} posts)")
         
         return True
         
@@ -52,21 +60,20 @@ def get_post_count_with_login(username, username_login=None, password=None):
             L.login(username_login, password)
         
         profile = instaloader.Profile.from_username(L.context, username)
-        posts = profile.get_posts()
-        count = sum(1 for _ in posts)  # Count all posts
-        return count
+        # The profile metadata already carries the total, no need to page through every post
+        return profile.mediacount
     except Exception as e:
         print(f"Error getting post count: {str(e)}")
         return 0
 
-def download_with_session(username, session_file=None):
+def download_with_session(username, session_file=None, username_login=None, since=None, until=None, limit=None, archive_format=None):
     """
     Download using a saved session file (more secure than username/password)
     """
     print(f"Starting download of profile: {username} using session")
     
     # Create an Instaloader instance
-    loader = instaloader.Instaloader()
+    loader = ResumableInstaloader()
     loader.save_metadata = False
     loader.post_metadata_txt_pattern = ""
     loader.dirname_pattern = f"./downloads/{username}"  # Download to local directory
@@ -74,7 +81,7 @@ def download_with_session(username, session_file=None):
     # Load session if file is provided
     if session_file and os.path.isfile(session_file):
         try:
-            loader.load_session_from_file(username_login, session_file)
+            loader.load_session_from_file(username_login or username, session_file)
             print("Session loaded successfully")
         except Exception as e:
             print(f"Session loading failed: {str(e)}")
@@ -82,8 +89,9 @@ def download_with_session(username, session_file=None):
     
     try:
         # Download the profile
-        loader.download_profile(username, profile_pic=True, profile_pic_only=False)
-        print(f"Download of profile {username} completed successfully!")
+        posts_count = download_profile_posts(loader, username, since=since, until=until, limit=limit,
+                                             archive_format=archive_format)
+        print(f"Download of profile {username} completed successfully! ({posts_count} posts)")
         
         return True
         
@@ -98,35 +106,73 @@ def download_with_session(username, session_file=None):
     return False
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python3 download_instagram_profile_with_login.py <target_username> [session_file]")
-        print("       python3 download_instagram_profile_with_login.py <target_username> <login_username> <password>")
-        print("Example 1: python3 download_instagram_profile_with_login.py alvelalucas my_session")
-        print("Example 2: python3 download_instagram_profile_with_login.py alvelalucas myusername mypassword")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Download media from an Instagram profile, optionally logged in",
+        usage="%(prog)s <target_username> [session_file | login_username password] [--since DATE] [--until DATE] [--limit N]\n"
+              "       %(prog)s --batch FILE [session_file | login_username password] [--workers N] [--summary PATH]",
+        epilog="Example 1: python3 download_instagram_profile_with_login.py alvelalucas my_session\n"
+               "Example 2: python3 download_instagram_profile_with_login.py alvelalucas myusername mypassword --since 2024-01-01\n"
+               "Batch:     python3 download_instagram_profile_with_login.py --batch targets.txt myusername mypassword",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("target_username", nargs="?", help="Instagram profile to download (omitted with --batch)")
+    parser.add_argument("credentials", nargs="*", help="a session file, or a login username and password")
+    add_window_arguments(parser)
+    add_storage_arguments(parser)
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+    window = dict(since=args.since, until=args.until, limit=args.limit,
+                  archive_format=args.archive)
+    
+    if args.batch:
+        # Without a single target every positional argument is a credential
+        credentials = ([args.target_username] if args.target_username else []) + args.credentials
+        if len(credentials) > 2:
+            parser.error("expected either a session file or a login username and password")
+        
+        # Log in once; every worker shares this session and its rate limits
+        loader = create_batch_loader()
+        try:
+            if len(credentials) == 1:
+                login_username = load_batch_session(loader, credentials[0])
+                print(f"Session loaded successfully ({login_username})")
+            elif len(credentials) == 2:
+                loader.login(*credentials)
+                print("Logged in successfully")
+        except Exception as e:
+            print(f"Login failed: {str(e)}")
+            sys.exit(1)
+        
+        summary = run_batch(loader, read_targets(args.batch), workers=args.workers,
+                            summary_path=args.summary, **window)
+        sys.exit(1 if summary['failed'] else 0)
+    
+    if not args.target_username:
+        parser.error("a target username is required unless --batch is given")
+    if len(args.credentials) > 2:
+        parser.error("expected either a session file or a login username and password")
     
-    target_username = sys.argv[1]
+    target_username = args.target_username
     
     # Create downloads directory
     os.makedirs(f"./downloads/{target_username}", exist_ok=True)
     
-    if len(sys.argv) == 3:  # Using session file
-        session_file = sys.argv[2]
+    if len(args.credentials) == 1:  # Using session file
+        session_file = args.credentials[0]
         print(f"Using session file: {session_file}")
-        download_with_session(target_username, session_file)
-    elif len(sys.argv) == 4:  # Using username and password
-        login_username = sys.argv[2]
-        password = sys.argv[3]
+        download_with_session(target_username, session_file, **window)
+    elif len(args.credentials) == 2:  # Using username and password
+        login_username, password = args.credentials
         print(f"Getting post count for {target_username}...")
         post_count = get_post_count_with_login(target_username, login_username, password)
         print(f"Found {post_count} posts for {target_username}")
         
         print(f"Starting download for {target_username}...")
-        download_profile_with_login(target_username, login_username, password)
+        download_profile_with_login(target_username, login_username, password, **window)
     else:  # No authentication
         print(f"Getting post count for {target_username}...")
         post_count = get_post_count_with_login(target_username)
         print(f"Found {post_count} posts for {target_username}")
         
         print(f"Starting download for {target_username}...")
-        download_profile_with_login(target_username)
\ No newline at end of file
+        download_profile_with_login(target_username, **window)
\ No newline at end of file
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
 import instaloader
-import sys
+import argparse
 import os
+import sys
+
+from archive_storage import add_storage_arguments
+from batch_download import add_batch_arguments, create_batch_loader, load_batch_session, read_targets, run_batch
+from media_transfer import ResumableInstaloader
+from profile_download import add_window_arguments, download_profile_posts
 
 def create_instagram_session(username, password):
     """
@@ -24,11 +30,11 @@ def create_instagram_session(username, password):
         print(f"Error logging in: {e}")
         return False
 
-def download_with_session(target_username, session_file):
+def download_with_session(target_username, session_file, since=None, until=None, limit=None, archive_format=None):
     """
-    Download Instagram content using a saved session file
+    Download Instagram content using a saved session file, optionally limited to a date range or post count
     """
-    L = instaloader.Instaloader()
+    L = ResumableInstaloader()
     
     try:
         # Load the session
@@ -41,33 +47,56 @@ def download_with_session(target_username, session_file):
         L.post_metadata_txt_pattern = ''
         
         # Download the profile
-        L.download_profile(target_username, profile_pic=True, profile_pic_only=False)
-        print(f"Download of {target_username} completed successfully!")
+        post_count = download_profile_posts(L, target_username, since=since, until=until, limit=limit,
+                                             archive_format=archive_format)
+        print(f"Download of {target_username} completed successfully! ({post_count} posts)")
         return True
     except Exception as e:
         print(f"Error downloading: {e}")
         return False
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage:")
-        print("  To create session: python3 insta_session.py <instagram_username> <instagram_password>")
-        print("  To download using session: python3 insta_session.py <target_username> <session_file>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        usage="%(prog)s <instagram_username> <instagram_password>\n"
+              "       %(prog)s <session_file> <target_username> [--since DATE] [--until DATE] [--limit N]\n"
+              "       %(prog)s <session_file> [login_username] --batch FILE [--workers N] [--summary PATH]",
+        description="Create an Instagram session file, or download a profile using one",
+    )
+    parser.add_argument("arg1", metavar="username_or_session_file")
+    parser.add_argument("arg2", metavar="password_or_target_username", nargs="?")
+    add_window_arguments(parser)
+    add_storage_arguments(parser)
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+    
+    arg1 = args.arg1
+    arg2 = args.arg2
     
-    arg1 = sys.argv[1]
-    arg2 = sys.argv[2] if len(sys.argv) > 2 else None
+    if args.batch:
+        # Load the session once; every worker shares it and its rate limits
+        loader = create_batch_loader()
+        try:
+            login_username = load_batch_session(loader, arg1, arg2)
+            print(f"Session loaded for {login_username}")
+        except Exception as e:
+            print(f"Error loading session: {e}")
+            sys.exit(1)
+        summary = run_batch(loader, read_targets(args.batch), workers=args.workers,
+                            summary_path=args.summary, since=args.since, until=args.until, limit=args.limit,
+                            archive_format=args.archive)
+        sys.exit(1 if summary['failed'] else 0)
     
     if not arg2:
         print("Please provide both Instagram username and password or target username and session file")
-        sys.exit(1)
+        parser.exit(1)
     
     # If first argument is likely a session file (not an Instagram username pattern)
     if os.path.isfile(arg1):
         # Download using session file
         session_file = arg1
         target_username = arg2
-        download_with_session(target_username, session_file)
+        download_with_session(target_username, session_file, since=args.since, until=args.until, limit=args.limit,
+                              archive_format=args.archive)
     else:
         # Create session
         username = arg1
@@ -1,8 +1,13 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, Response
 import instaloader
 import os
+import sys
+import json
+import mimetypes
+import tarfile
+import zipfile
 import tempfile
-from threading import Thread
+from threading import Thread, Condition, Lock
 import time
 import hashlib
 import secrets
@@ -14,6 +19,13 @@ from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 
+# Helpers shared with the command line downloaders live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from archive_storage import ARCHIVE_FORMATS, ProfileArchive, archive_path_for, open_archived_file
+from media_transfer import ResumableInstaloader
+from post_window import iter_posts_in_window, parse_window_date, validate_window
+from storage_quota import StorageManager, quota_from_env
+
 app = Flask(__name__)
 # Generate a secure random secret key
 app.secret_key = secrets.token_hex(16)
@@ -21,6 +33,77 @@ app.secret_key = secrets.token_hex(16)
 # Store active downloads
 active_downloads = {}
 
+# Structured progress for each download, streamed to clients by /events/<target_username>
+download_progress = {}
+
+# Options and email recipients of the latest job for each target; requests for a target that
+# is already downloading attach to its job instead of starting a second one
+download_jobs = {}
+download_jobs_lock = Lock()
+
+class DownloadProgress:
+    """Structured progress of a single profile download that clients can wait on"""
+
+    FINAL_STATES = ('completed', 'failed')
+
+    def __init__(self, target_username):
+        self._condition = Condition()
+        self.version = 0
+        self.started_at = time.time()
+        self.state = {
+            'target': target_username,
+            'state': 'starting',
+            'message': 'Starting download...',
+            'posts_total': None,
+            'posts_done': 0,
+            'files_downloaded': 0,
+            'bytes_transferred': 0,
+            'bytes_per_second': 0.0,
+            'posts_per_second': 0.0,
+            'eta_seconds': None,
+            'elapsed_seconds': 0.0,
+            'result': None,
+        }
+
+    def update(self, **fields):
+        """Merge new fields, recompute rate and ETA and wake up every waiting client"""
+        with self._condition:
+            self.state.update(fields)
+            elapsed = max(time.time() - self.started_at, 1e-6)
+            self.state['elapsed_seconds'] = round(elapsed, 2)
+            self.state['bytes_per_second'] = round(self.state['bytes_transferred'] / elapsed, 1)
+            posts_per_second = self.state['posts_done'] / elapsed
+            self.state['posts_per_second'] = round(posts_per_second, 3)
+            total = self.state['posts_total']
+            # The ETA uses the unrounded rate; a very slow start would otherwise round it to zero
+            if total and posts_per_second > 0 and self.state['state'] == 'downloading':
+                remaining = max(total - self.state['posts_done'], 0)
+                self.state['eta_seconds'] = round(remaining / posts_per_second, 1)
+            elif self.state['state'] in self.FINAL_STATES:
+                self.state['eta_seconds'] = 0
+            self.version += 1
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._condition:
+            return self.version, dict(self.state)
+
+    def wait_for_change(self, seen_version, timeout):
+        """Block until the progress moves past seen_version; returns (version, state) or (seen_version, None) on timeout"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.version != seen_version, timeout=timeout)
+            if self.version == seen_version:
+                return seen_version, None
+            return self.version, dict(self.state)
+
+def report_progress(target_username, message, **fields):
+    """Update both the free-text status and the structured progress of a download"""
+    active_downloads[target_username] = message
+    progress = download_progress.get(target_username)
+    if progress is None:
+        progress = download_progress[target_username] = DownloadProgress(target_username)
+    progress.update(message=message, **fields)
+
 # Configuration for email sending (these would come from environment variables in a real app)
 EMAIL_CONFIG = {
     'server': 'smtp.gmail.com',
@@ -64,15 +147,23 @@ def secure_session_filename(username):
     hashed = hashlib.sha256(username.encode()).hexdigest()[:12]
     return f"session_{hashed}.session"
 
-def cleanup_session_files():
-    """Clean up session files after a certain period"""
-    session_dir = "./"
-    for file in os.listdir(session_dir):
-        if file.startswith("session_") and file.endswith(".session"):
-            file_path = os.path.join(session_dir, file)
-            # Remove session files older than 1 hour
-            if time.time() - os.path.getmtime(file_path) > 3600:
-                os.remove(file_path)
+def is_download_in_progress(target_username):
+    """True while a download of target_username has not completed or failed"""
+    progress = download_progress.get(target_username)
+    if progress is None:
+        return False
+    return progress.snapshot()[1]['state'] not in DownloadProgress.FINAL_STATES
+
+# Keeps ./downloads and the session files within their quotas; sessions also expire after an hour
+storage_manager = StorageManager(
+    downloads_dir='./downloads',
+    downloads_quota=quota_from_env('DOWNLOADS_QUOTA_MB', 5120),
+    sessions_dir='./',
+    sessions_quota=quota_from_env('SESSIONS_QUOTA_MB', 10),
+    session_max_age=int(os.environ.get('SESSION_MAX_AGE_SECONDS', 3600)),
+    interval=int(os.environ.get('STORAGE_SWEEP_SECONDS', 300)),
+    is_busy=is_download_in_progress,
+)
 
 def create_instagram_session(login_identifier, password):
     """
@@ -153,26 +244,31 @@ def send_email_with_attachments(to_email, subject, body, attachment_paths):
     except Exception as e:
         return False, f"Failed to send email: {str(e)}"
 
-def download_profile_with_session(target_username, session_file, login_username, send_email=False, email_address=None):
+def download_profile_with_session(target_username, session_file, login_username, send_email=False, email_address=None,
+                                  since=None, until=None, limit=None, archive_format=None):
     """
-    Download Instagram content using a saved session file
+    Download Instagram content using a saved session file, optionally only the posts
+    taken between since and until and at most limit of them.
+    With archive_format ("zip" or "tar") the files are appended to ./downloads/<target_username>.<format>
+    as each post completes instead of being kept as loose files.
     """
     # Validate target username (this should still be a valid Instagram username)
     if not validate_instagram_username(target_username):
-        active_downloads[target_username] = f"Invalid target username: {target_username}"
+        report_progress(target_username, f"Invalid target username: {target_username}", state='failed')
         return False, f"Invalid target username: {target_username}"
 
     # Validate login username (could be email, phone or username)
     if not validate_instagram_login_identifier(login_username):
-        active_downloads[target_username] = f"Invalid login username: {login_username}"
+        report_progress(target_username, f"Invalid login username: {login_username}", state='failed')
         return False, f"Invalid login username: {login_username}"
 
     # Validate that session_file is in expected format (not arbitrary paths)
     if '..' in session_file or session_file.startswith('/') or not session_file.endswith('.session'):
-        active_downloads[target_username] = "Invalid session file"
+        report_progress(target_username, "Invalid session file", state='failed')
         return False, "Invalid session file"
 
-    L = instaloader.Instaloader()
+    L = ResumableInstaloader()
+    archive = None
 
     try:
         # Load the session
@@ -186,56 +282,126 @@ def download_profile_with_session(target_username, session_file, login_username,
         L.post_metadata_txt_pattern = ''
 
         # Download the profile
+        validate_window(since, until, limit)
         profile = instaloader.Profile.from_username(L.context, target_username)
-        posts = profile.get_posts()
+        posts = iter_posts_in_window(profile.get_posts(), since, until, limit)
+
+        # A date range makes the number of matching posts unknown until the crawl ends
+        posts_total = None if since or until else profile.mediacount
+        if limit and posts_total is not None:
+            posts_total = min(limit, posts_total)
+        report_progress(target_username, f"Found {profile.mediacount} posts...",
+                        state='downloading', posts_total=posts_total)
+
+        if archive_format:
+            archive = ProfileArchive(download_dir, archive_format)
+            archive.open()
+            L.attach_archive(archive)
+
+        # Counted as each file lands; files already on disk from an earlier run are skipped, not counted
+        transferred = {'files': 0, 'bytes': 0}
+
+        def count_transfer(filename, size):
+            transferred['files'] += 1
+            transferred['bytes'] += size
+        L.on_transfer = count_transfer
 
         post_count = 0
         for post in posts:
             L.download_post(post, target=f'{target_username}')
             post_count += 1
 
-            # Simple progress tracking (in a real app you might want to use websockets)
-            active_downloads[target_username] = f"Downloaded {post_count} posts..."
+            if archive:
+                archive.absorb()
+
+            report_progress(target_username, f"Downloaded {post_count} posts...",
+                            posts_done=post_count, files_downloaded=transferred['files'],
+                            bytes_transferred=transferred['bytes'])
+
+        if archive:
+            archive.close()
 
         # Update status when complete
         download_completion_msg = f"Download of {target_username} completed successfully! ({post_count} posts)"
-        active_downloads[target_username] = download_completion_msg
+        final_message = download_completion_msg
+
+        # Recipients of every request attached to this job; none can attach from here on
+        with download_jobs_lock:
+            job = download_jobs.get(target_username)
+            if job is not None:
+                job['accepting'] = False
+                recipients = list(job['email_addresses'])
+            else:
+                recipients = [email_address] if send_email and email_address else []
+        # The status is shared by every attached requester, so several addresses are only counted
+        email_address = recipients[0] if len(recipients) == 1 else f"{len(recipients)} recipients"
 
         # If email requested, send the downloaded files
-        if send_email and email_address:
-            # Get all files in the download directory
+        if recipients:
+            report_progress(target_username, f"{download_completion_msg} Sending files to {email_address}...",
+                            state='emailing')
+
+            # Send the archive as a single attachment, or every file in the download directory
             attachment_paths = []
-            for root, dirs, files in os.walk(download_dir):
-                for file in files:
-                    attachment_paths.append(os.path.join(root, file))
+            if archive:
+                attachment_paths.append(archive.path)
+            else:
+                for root, dirs, files in os.walk(download_dir):
+                    for file in files:
+                        attachment_paths.append(os.path.join(root, file))
 
             if attachment_paths:
-                success, msg = send_email_with_attachments(
-                    email_address,
-                    f"Instagram Download - {target_username}",
-                    f"Download of Instagram profile {target_username} completed with {post_count} posts.",
-                    attachment_paths
-                )
-                if success:
-                    active_downloads[target_username] = f"{download_completion_msg} Files sent to {email_address}."
+                # One email per recipient, so attached requesters don't see each other's addresses
+                failures = []
+                for recipient in recipients:
+                    success, msg = send_email_with_attachments(
+                        recipient,
+                        f"Instagram Download - {target_username}",
+                        f"Download of Instagram profile {target_username} completed with {post_count} posts.",
+                        attachment_paths
+                    )
+                    if not success:
+                        failures.append(msg)
+                if not failures:
+                    final_message = f"{download_completion_msg} Files sent to {email_address}."
                 else:
-                    active_downloads[target_username] = f"{download_completion_msg} But failed to send email: {msg}"
+                    final_message = f"{download_completion_msg} But failed to send {len(failures)} of {len(recipients)} emails: {failures[0]}"
             else:
-                active_downloads[target_username] = f"{download_completion_msg} But no files found to send."
+                final_message = f"{download_completion_msg} But no files found to send."
 
+        storage_manager.touch(target_username)
+        report_progress(target_username, final_message, state='completed',
+                        result={'success': True, 'posts': post_count, 'files': transferred['files'],
+                                'bytes': transferred['bytes'], 'directory': download_dir,
+                                'archive': archive.path if archive else None})
         return True, download_completion_msg
     except instaloader.exceptions.ProfileNotExistsException:
         error_msg = f"Profile {target_username} does not exist"
-        active_downloads[target_username] = error_msg
+        report_progress(target_username, error_msg, state='failed', result={'success': False, 'error': error_msg})
         return False, error_msg
     except instaloader.exceptions.BadCredentialsException:
         error_msg = "Invalid credentials. Please check your session file and username."
-        active_downloads[target_username] = error_msg
+        report_progress(target_username, error_msg, state='failed', result={'success': False, 'error': error_msg})
         return False, error_msg
     except Exception as e:
         error_msg = str(e)
-        active_downloads[target_username] = f"Error: {error_msg}"
+        report_progress(target_username, f"Error: {error_msg}", state='failed',
+                        result={'success': False, 'error': error_msg})
         return False, error_msg
+    finally:
+        # Keep whatever was archived before a failure readable
+        if archive:
+            archive.close()
+
+@app.before_request
+def start_storage_manager():
+    """
+    Start the quota sweeps in the process that serves requests.
+
+    Only this process knows which downloads are running; the debug reloader's
+    parent process would otherwise evict them and overwrite the access log.
+    """
+    storage_manager.start()
 
 @app.route('/')
 def index():
@@ -275,6 +441,19 @@ def download_profile():
     login_username = request.form.get('login_username')
     send_email = request.form.get('send_email') == 'on'  # Checkbox value
     email_address = request.form.get('email_address', '').strip()
+    limit = request.form.get('limit', '').strip()
+    archive_format = request.form.get('storage', 'files')
+    if archive_format not in ARCHIVE_FORMATS:
+        archive_format = None
+
+    try:
+        since = parse_window_date(request.form.get('since', '').strip())
+        until = parse_window_date(request.form.get('until', '').strip(), end_of_day=True)
+        limit = int(limit) if limit else None
+        validate_window(since, until, limit)
+    except ValueError as e:
+        flash(f'Invalid date range or post limit: {e}')
+        return redirect(url_for('index'))
 
     if not target_username or not session_file or not login_username:
         flash('Please provide target username, session file, and login username.')
@@ -305,13 +484,40 @@ def download_profile():
         flash(f'Invalid or non-existent session file: {session_file}')
         return redirect(url_for('index'))
 
-    # Initialize download status
-    active_downloads[target_username] = "Starting download..."
+    # Attach to a running download of the same target instead of starting a competing one
+    options = (session_file, since, until, limit, archive_format)
+    with download_jobs_lock:
+        job = download_jobs.get(target_username)
+        if job is not None and is_download_in_progress(target_username):
+            if job['options'] != options:
+                flash(f'A download of {target_username} with different options is already running. '
+                      f'Please wait for it to finish and try again.')
+                return redirect(url_for('index'))
+            if not job['accepting']:
+                flash(f'The download of {target_username} is already sending its files. '
+                      f'Please wait for it to finish and try again.')
+                return redirect(url_for('index'))
+            if send_email and email_address not in job['email_addresses']:
+                job['email_addresses'].append(email_address)
+            flash(f'A download of {target_username} is already running; this request was attached to it. '
+                  f'You can check the status below.')
+            return redirect(url_for('index'))
+
+        download_jobs[target_username] = {
+            'options': options,
+            'email_addresses': [email_address] if send_email else [],
+            'accepting': True,
+        }
+        # Initialize download status; an unfinished download also keeps the profile from being evicted
+        download_progress[target_username] = DownloadProgress(target_username)
+        report_progress(target_username, "Starting download...", state='starting')
+    storage_manager.touch(target_username)
 
     # Start download in a separate thread
     thread = Thread(
         target=download_profile_with_session,
-        args=(target_username, session_file, login_username, send_email, email_address)
+        args=(target_username, session_file, login_username, send_email, email_address),
+        kwargs={'since': since, 'until': until, 'limit': limit, 'archive_format': archive_format}
     )
     thread.daemon = True  # Thread will close when main process ends
     thread.start()
@@ -328,12 +534,76 @@ def download_status(target_username):
     status = active_downloads.get(target_username, "No active download")
     return {"status": status}
 
+@app.route('/archive/<target_username>')
+def download_archive(target_username):
+    """Serve a profile archive, or a single file from it with ?file=<name>"""
+    if not validate_instagram_username(target_username):
+        return jsonify({"status": "Invalid username"}), 400
+
+    for archive_format in ARCHIVE_FORMATS:
+        archive_path = archive_path_for(f'./downloads/{target_username}', archive_format)
+        if os.path.exists(archive_path):
+            break
+    else:
+        return jsonify({"status": "No archive for this profile"}), 404
+
+    # The archive and its index are swapped when the download finishes
+    if is_download_in_progress(target_username):
+        return jsonify({"status": "The download of this profile is still running"}), 409
+
+    storage_manager.touch(target_username)
+    name = request.args.get('file')
+    if not name:
+        return send_file(os.path.abspath(archive_path), as_attachment=True)
+    try:
+        size, chunks = open_archived_file(archive_path, name)
+    except (KeyError, OSError):
+        return jsonify({"status": f"File not found in archive: {name}"}), 404
+    except (zipfile.BadZipFile, tarfile.TarError, ValueError):
+        return jsonify({"status": "The archive of this profile is unreadable"}), 500
+    # Streamed in chunks, so a large video never sits in memory whole
+    mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    response = Response(chunks, mimetype=mimetype, direct_passthrough=True)
+    response.content_length = size
+    response.headers.set('Content-Disposition', 'inline', filename=os.path.basename(name))
+    return response
+
+@app.route('/storage')
+def storage_usage():
+    """Disk usage of downloads and session files against their quotas, as of the last sweep"""
+    return jsonify(storage_manager.usage())
+
+@app.route('/events/<target_username>')
+def download_events(target_username):
+    """Stream structured download progress as Server-Sent Events"""
+    if not validate_instagram_username(target_username):
+        return jsonify({"status": "Invalid username"}), 400
+
+    progress = download_progress.get(target_username)
+    if progress is None:
+        return jsonify({"status": "No active download"}), 404
+
+    def stream():
+        seen_version = -1
+        while True:
+            seen_version, state = progress.wait_for_change(seen_version, timeout=15)
+            if state is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            event = 'result' if state['state'] in DownloadProgress.FINAL_STATES else 'progress'
+            yield f"event: {event}\ndata: {json.dumps(state)}\n\n"
+            if event == 'result':
+                return
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 if __name__ == '__main__':
     # Create necessary directories
     os.makedirs('./downloads', exist_ok=True)
     os.makedirs('./templates', exist_ok=True)
 
-    # Perform cleanup of old session files
-    cleanup_session_files()
-
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -84,7 +84,7 @@ class InstaLoaderPWA {
             const response = await fetch(`${this.apiBaseUrl}/api/download`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ target, download_type: downloadType }),
+                body: JSON.stringify({ target, download_type: downloadType, manifest: 'compact' }),
                 cache: 'no-cache'
             });
 
@@ -95,7 +95,9 @@ class InstaLoaderPWA {
             }
 
             const data = await response.json();
-            const urls = data.media_urls || [];
+            const urls = data.manifest
+                ? this.decodeManifest(data.manifest).map(item => item.url)
+                : (data.media_urls || []);
             if (!urls.length) {
                 this.updateStatus('No media items were returned for this request.', 'info');
                 return;
@@ -109,6 +111,25 @@ class InstaLoaderPWA {
         }
     }
 
+    decodeManifest(manifest) {
+        // Entries are positional (see manifest.fields); each URL shares its first
+        // `shared` characters with the previous entry's URL.
+        const column = Object.fromEntries(manifest.fields.map((field, index) => [field, index]));
+        let previousUrl = '';
+        return manifest.entries.map(entry => {
+            const url = previousUrl.slice(0, entry[column.shared]) + entry[column.suffix];
+            previousUrl = url;
+            return {
+                url,
+                shortcode: entry[column.shortcode],
+                type: entry[column.type],
+                width: entry[column.width],
+                height: entry[column.height],
+                takenAt: new Date(entry[column.taken_at] * 1000)
+            };
+        });
+    }
+
     updateStatus(message, type = 'info') {
         this.statusText.textContent = message;
         this.statusText.className = type;
@@ -0,0 +1,220 @@
+"""
+Resumable, verified transfers for downloaded media.
+
+Instaloader streams every file straight to its final name, so a dropped
+connection restarts a long video from byte zero and can leave a truncated file
+behind that later runs mistake for a complete download. Here a file is written
+to "<name>.part", resumed with an HTTP Range request after a failure, checked
+against Content-Length/Content-Range (and a SHA-256 digest when one is known),
+and only then renamed into place.
+"""
+
+import hashlib
+import os
+import random
+import re
+import time
+from datetime import datetime
+
+import instaloader
+import requests
+
+CHUNK_SIZE = 256 * 1024
+# Client errors other than these will not go away by retrying
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+_CONTENT_RANGE_PATTERN = re.compile(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)')
+
+
+class TransferError(Exception):
+    """A transfer failed in a way that retrying may fix"""
+
+
+class TransferVerificationError(TransferError):
+    """The transferred file does not have the expected size or digest"""
+
+
+def part_path_for(path):
+    return f"{path}.part"
+
+
+def _parse_content_range(value):
+    """Return (first_byte, total) of a Content-Range header; either may be None"""
+    match = _CONTENT_RANGE_PATTERN.fullmatch((value or '').strip())
+    if match is None:
+        return None, None
+    first_byte = int(match.group(1)) if match.group(1) is not None else None
+    total = int(match.group(3)) if match.group(3) != '*' else None
+    return first_byte, total
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _transfer_once(session, url, part_path, timeout, on_response):
+    """
+    Append the missing bytes of url to part_path with one request.
+
+    Returns the total size of the resource when the server reported it.
+    """
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    # Byte offsets only line up with the stored representation, never a re-encoded one
+    headers = {'Accept-Encoding': 'identity'}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416 and offset:
+            # Nothing left to fetch if the part already holds the whole resource
+            _, total = _parse_content_range(response.headers.get('Content-Range'))
+            if total == offset:
+                return total
+            os.remove(part_path)
+            raise TransferError(f"Range not satisfiable at byte {offset}, restarting")
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise TransferError(f"HTTP {response.status_code}")
+        response.raise_for_status()
+        if on_response is not None:
+            on_response(response)
+
+        if response.status_code == 206:
+            first_byte, total = _parse_content_range(response.headers.get('Content-Range'))
+            if first_byte != offset:
+                os.remove(part_path)
+                raise TransferError(f"Server resumed at byte {first_byte} instead of {offset}, restarting")
+            mode = 'ab'
+        else:
+            # The server ignored the Range header and sent the whole file
+            offset = 0
+            total = None
+            mode = 'wb'
+
+        expected = response.headers.get('Content-Length')
+        expected = int(expected) if expected and expected.isdigit() else None
+        if total is None and expected is not None:
+            total = offset + expected
+
+        received = 0
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                received += len(chunk)
+
+    if expected is not None and received != expected:
+        raise TransferError(f"Connection closed after {received} of {expected} bytes")
+    return total
+
+
+def fetch_to_file(session, url, path, expected_size=None, sha256=None, retries=4, backoff=1.0, timeout=30,
+                  on_response=None):
+    """
+    Download url to path through a resumable "<path>.part" file.
+
+    Failed attempts resume where they stopped, after an exponential backoff with jitter.
+    Before the part file is atomically renamed to path, its size is checked against the
+    size the server reported and expected_size, and its digest against sha256, when given.
+    on_response(response) is called with each successful response before its body is read.
+    Returns the number of bytes of the finished file.
+    """
+    part_path = part_path_for(path)
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            total = _transfer_once(session, url, part_path, timeout, on_response)
+            size = os.path.getsize(part_path)
+            for label, wanted in (('reported', total), ('expected', expected_size)):
+                if wanted is not None and size != wanted:
+                    raise TransferVerificationError(f"{size} bytes on disk, {wanted} bytes {label}")
+            if sha256 is not None and _file_sha256(part_path) != sha256.lower():
+                raise TransferVerificationError("SHA-256 digest does not match")
+            os.replace(part_path, path)
+            return size
+        except (TransferError, requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            if isinstance(e, TransferVerificationError) and os.path.exists(part_path):
+                os.remove(part_path)  # Resuming a corrupt file cannot fix it
+            if attempt > retries:
+                raise
+            delay = backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            print(f"Transfer of {os.path.basename(path)} failed ({e}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1} of {retries + 1})")
+            time.sleep(delay)
+
+
+class ResumableInstaloader(instaloader.Instaloader):
+    """
+    Instaloader whose pictures and videos are fetched with fetch_to_file.
+
+    on_transfer(filename, size) is called after each file is fetched and renamed into place.
+    """
+
+    def __init__(self, *args, transfer_retries=4, transfer_backoff=1.0, on_transfer=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transfer_retries = transfer_retries
+        self.transfer_backoff = transfer_backoff
+        self.on_transfer = on_transfer
+        self._transfer_session = None
+        # Download directory -> ProfileArchive whose members count as already downloaded
+        self._archives = {}
+
+    def attach_archive(self, archive):
+        """Skip files of archive.directory that the archive already holds instead of fetching them again"""
+        self._archives[os.path.abspath(archive.directory)] = archive
+
+    def detach_archive(self, archive):
+        self._archives.pop(os.path.abspath(archive.directory), None)
+
+    def _is_archived(self, file_path):
+        archive = self._archives.get(os.path.dirname(os.path.abspath(file_path)))
+        return archive is not None and archive.contains(file_path)
+
+    def download_pic(self, filename, url, mtime, filename_suffix=None, _attempt=1):
+        """Same naming and skipping rules as Instaloader.download_pic, with a resumable, verified transfer"""
+        if filename_suffix is not None:
+            filename += '_' + filename_suffix
+        urlmatch = re.search('\\.[a-z0-9]*\\?', url)
+        file_extension = url[-3:] if urlmatch is None else urlmatch.group(0)[1:-1]
+        nominal_filename = filename + '.' + file_extension
+        if os.path.isfile(nominal_filename) or self._is_archived(nominal_filename):
+            self.context.log(nominal_filename + ' exists', end=' ', flush=True)
+            return False
+
+        if self._transfer_session is None:
+            # CDN media needs no login; this mirrors the anonymous session Instaloader uses for it
+            self._transfer_session = self.context.get_anonymous_session()
+        final = {}
+
+        def name_from_response(response):
+            content_type = response.headers.get('Content-Type')
+            if content_type:
+                header_extension = '.' + content_type.split(';')[0].split('/')[-1]
+                final['filename'] = filename + header_extension.lower().replace('jpeg', 'jpg')
+            else:
+                final['filename'] = nominal_filename
+            if final['filename'] != nominal_filename and (os.path.isfile(final['filename'])
+                                                          or self._is_archived(final['filename'])):
+                raise FileExistsError(final['filename'])
+
+        # Resume data is kept under the nominal name, known before any response arrives
+        try:
+            size = fetch_to_file(self._transfer_session, url, nominal_filename, retries=self.transfer_retries,
+                                 backoff=self.transfer_backoff,
+                                 timeout=getattr(self.context, 'request_timeout', 300),
+                                 on_response=name_from_response)
+        except FileExistsError as e:
+            self.context.log(f'{e} exists', end=' ', flush=True)
+            return False
+        except (TransferError, requests.RequestException) as e:
+            raise instaloader.exceptions.ConnectionException(f"Failed to download {url}: {e}") from e
+        final_filename = final.get('filename', nominal_filename)
+        if final_filename != nominal_filename:
+            os.replace(nominal_filename, final_filename)
+        os.utime(final_filename, (datetime.now().timestamp(), mtime.timestamp()))
+        if self.on_transfer is not None:
+            self.on_transfer(final_filename, size)
+        return True
@@ -0,0 +1,79 @@
+"""
+Date-range and count limits for profile crawls.
+
+Instagram returns a profile's posts newest-first (after any pinned posts),
+so a crawl can stop paging as soon as it walks past the requested window
+instead of iterating the whole history.
+
+Only the standard library is used here, so the API can import this module
+without the download and command line helpers of profile_download.
+"""
+
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+
+
+def parse_window_date(value, end_of_day=False):
+    """
+    Parse an ISO 8601 date or datetime into a naive UTC datetime, matching Post.date_utc.
+
+    Date-only values mean the start of that day, or its last instant when end_of_day is set,
+    so "--until 2024-05-31" includes posts from the whole of May 31st.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = str(value).strip()
+        try:
+            parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        except ValueError:
+            raise ValueError(f"Invalid date: {value!r} (expected YYYY-MM-DD or an ISO 8601 datetime)")
+        if end_of_day and len(text) == 10:
+            parsed += timedelta(days=1, microseconds=-1)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def validate_window(since=None, until=None, limit=None):
+    """Check that a crawl window is consistent, raising ValueError otherwise"""
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be a positive number of posts")
+    if since is not None and until is not None and since > until:
+        raise ValueError("since must not be later than until")
+
+
+def iter_posts_in_window(posts, since=None, until=None, limit=None):
+    """
+    Yield the posts taken between since and until (both inclusive), newest first, at most limit of them.
+
+    Iteration stops at the first non-pinned post older than since, so only the pages
+    covering the window are fetched. Pinned posts come first in the feed but are out
+    of chronological order, so the ones inside the window are held back and yielded
+    once the crawl reaches their date; limit therefore counts the newest posts.
+    """
+    if limit is not None and limit < 1:
+        return
+    yield from islice(_merge_pinned_posts(posts, since, until), limit)
+
+
+def _merge_pinned_posts(posts, since, until):
+    held = []  # Pinned posts inside the window, newest first
+    for post in posts:
+        taken_at = post.date_utc
+        # Older instaloader releases have no is_pinned; treat their posts as unpinned
+        if getattr(post, 'is_pinned', False):
+            if (until is None or taken_at <= until) and (since is None or taken_at >= since):
+                held.append(post)
+                held.sort(key=lambda pinned: pinned.date_utc, reverse=True)
+            continue
+        while held and held[0].date_utc >= taken_at:
+            yield held.pop(0)
+        if until is not None and taken_at > until:
+            continue
+        if since is not None and taken_at < since:
+            break
+        yield post
+    yield from held
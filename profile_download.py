@@ -0,0 +1,85 @@
+"""
+Profile downloads shared by the command line downloaders and batch mode.
+
+Downloads the posts of a profile that fall in a since/until/limit window, and
+defines the matching command line options.
+"""
+
+import argparse
+
+import instaloader
+
+from archive_storage import ProfileArchive
+from media_transfer import ResumableInstaloader
+from post_window import iter_posts_in_window, parse_window_date, validate_window
+
+
+def download_profile_posts(loader, username, since=None, until=None, limit=None, profile_pic=True,
+                           archive_format=None):
+    """
+    Download the profile picture and the posts of a profile that fall in the window.
+
+    With archive_format ("zip" or "tar") every post's files are moved into the
+    profile archive as soon as the post is downloaded.
+    A post that fails to download is reported and skipped, as by Instaloader's download_profile;
+    other Instaloader exceptions, such as for a missing profile, are left to the caller.
+    Returns the number of posts downloaded.
+    """
+    validate_window(since, until, limit)
+    profile = instaloader.Profile.from_username(loader.context, username)
+    archive = None
+    if archive_format:
+        archive = ProfileArchive(loader.dirname_pattern.format(target=username), archive_format)
+        archive.open()
+        if isinstance(loader, ResumableInstaloader):
+            loader.attach_archive(archive)
+
+    try:
+        if profile_pic:
+            loader.download_profilepic(profile)
+            if archive:
+                archive.absorb()
+
+        post_count = 0
+        for post in iter_posts_in_window(profile.get_posts(), since, until, limit):
+            # As in Instaloader's own download loop, a failing post is reported and skipped
+            with loader.context.error_catcher(f"Download {post} of {username}"):
+                loader.download_post(post, target=username)
+                post_count += 1
+            if archive:
+                archive.absorb()
+        return post_count
+    finally:
+        if archive:
+            if isinstance(loader, ResumableInstaloader):
+                loader.detach_archive(archive)
+            archive.close()
+
+
+def _window_date_argument(end_of_day):
+    def parse(value):
+        try:
+            return parse_window_date(value, end_of_day=end_of_day)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return parse
+
+
+def _positive_int_argument(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"expected a positive number of posts, got {value!r}")
+    return number
+
+
+def add_window_arguments(parser):
+    """Add the --since/--until/--limit options shared by the command line downloaders"""
+    parser.add_argument('--since', type=_window_date_argument(False), default=None,
+                        help="only posts taken on or after this date (YYYY-MM-DD or ISO 8601)")
+    parser.add_argument('--until', type=_window_date_argument(True), default=None,
+                        help="only posts taken on or before this date (YYYY-MM-DD or ISO 8601)")
+    parser.add_argument('--limit', type=_positive_int_argument, default=None,
+                        help="download at most this many of the newest matching posts")
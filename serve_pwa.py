@@ -1,23 +1,194 @@
 #!/usr/bin/env python3
 """
 Simple HTTP server for serving the PWA
+
+Requests are handled on their own threads. Text assets are precompressed with
+gzip (and brotli when the optional brotli package is installed) at startup,
+every asset gets a strong ETag, fingerprinted files such as app.3f2a9c1d.js are
+cached as immutable, and file bodies are sent with sendfile().
 """
 
 import http.server
-import socketserver
+import gzip
+import hashlib
 import os
+import re
+import tempfile
+import threading
 from functools import partial
 
+try:
+    import brotli  # Optional: adds "br" variants when installed
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.html', '.css', '.js', '.json', '.svg', '.txt', '.webmanifest', '.map')
+# Smaller files gain nothing from compression once headers are counted
+MIN_COMPRESS_SIZE = 512
+# Fingerprinted file names: name.<8+ hex digits>.ext
+HASHED_ASSET_PATTERN = re.compile(r'\.[0-9a-f]{8,}\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+class StaticAsset:
+    """A file of the served directory with its ETag and precompressed variants"""
+
+    def __init__(self, path, cache_dir):
+        self.path = path
+        stat = os.stat(path)
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.size = stat.st_size
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        self.etag = f'"{digest[:32]}"'
+
+        # encoding -> (path, size, etag); each representation needs its own strong ETag
+        self.variants = {}
+        if path.endswith(COMPRESSIBLE_EXTENSIONS) and self.size >= MIN_COMPRESS_SIZE:
+            encoders = [('gzip', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                encoders.insert(0, ('br', lambda data: brotli.compress(data, quality=11)))
+            for encoding, compress in encoders:
+                compressed = compress(content)
+                if len(compressed) >= self.size:
+                    continue
+                variant_path = os.path.join(cache_dir, f'{digest}.{encoding}')
+                if not os.path.exists(variant_path):
+                    # A unique temp file, since two threads may rebuild the same changed asset at once
+                    fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix=f'{digest}.{encoding}.', suffix='.tmp')
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(compressed)
+                    os.replace(temp_path, variant_path)
+                self.variants[encoding] = (variant_path, len(compressed), f'"{digest[:32]}-{encoding}"')
+
+    def is_stale(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_mtime_ns, stat.st_size) != self.signature
+
+
+class StaticAssetCache:
+    """Precompressed assets of a directory, refreshed when a file changes on disk"""
+
+    def __init__(self, directory, cache_dir=None):
+        self.directory = os.path.abspath(directory)
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'serve_pwa_cache')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def precompress(self):
+        """Build every asset up front so the first visitors don't pay for compression"""
+        count = 0
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                self.get(os.path.join(root, name))
+                count += 1
+        return count
+
+    def get(self, path):
+        """Return the StaticAsset for a file path, or None if it is not a regular file"""
+        if not os.path.isfile(path):
+            return None
+        with self._lock:
+            asset = self._assets.get(path)
+        if asset is None or asset.is_stale():
+            asset = StaticAsset(path, self.cache_dir)
+            with self._lock:
+                self._assets[path] = asset
+        return asset
+
+
 class CORSHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, *args, assets=None, **kwargs):
+        self.assets = assets
+        super().__init__(*args, **kwargs)
+
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', '*')
         super().end_headers()
 
+    def do_GET(self):
+        self.send_asset(include_body=True)
+
+    def do_HEAD(self):
+        self.send_asset(include_body=False)
+
+    def accepted_encodings(self):
+        accepted = set()
+        for part in self.headers.get('Accept-Encoding', '').split(','):
+            name, _, params = part.strip().partition(';')
+            if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                accepted.add(name.strip().lower())
+        return accepted
+
+    def send_asset(self, include_body):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            index = os.path.join(path, 'index.html')
+            if not self.path.split('?', 1)[0].endswith('/') or not os.path.isfile(index):
+                # Directory redirects and listings keep the standard behaviour
+                return super().do_GET() if include_body else super().do_HEAD()
+            path = index
+
+        asset = self.assets.get(path) if self.assets else None
+        if asset is None:
+            self.send_error(404, "File not found")
+            return
+
+        file_path, size, etag, encoding = asset.path, asset.size, asset.etag, None
+        accepted = self.accepted_encodings()
+        for candidate in ('br', 'gzip'):
+            if candidate in asset.variants and candidate in accepted:
+                encoding = candidate
+                file_path, size, etag = asset.variants[candidate]
+                break
+
+        basename = os.path.basename(asset.path)
+        cache_control = IMMUTABLE_CACHE_CONTROL if HASHED_ASSET_PATTERN.search(basename) else REVALIDATE_CACHE_CONTROL
+
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        try:
+            f = open(file_path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        with f:
+            self.send_response(200)
+            self.send_header('Content-Type', self.guess_type(asset.path))
+            self.send_header('Content-Length', str(size))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.end_headers()
+            if include_body:
+                # Hand the copy to the kernel instead of reading the file through Python
+                self.connection.sendfile(f, count=size)
+
+
 def serve_pwa(port=8080, directory='instaloader_pwa'):
-    handler = partial(CORSHandler, directory=directory)
-    with socketserver.TCPServer(("", port), handler) as httpd:
+    assets = StaticAssetCache(directory)
+    print(f"Prepared {assets.precompress()} assets with ETags and gzip variants (brotli {'enabled' if brotli else 'not installed'})")
+    handler = partial(CORSHandler, directory=directory, assets=assets)
+    with http.server.ThreadingHTTPServer(("", port), handler) as httpd:
         print(f"Serving PWA at http://localhost:{port}")
         print(f"Serving from directory: {os.path.join(os.getcwd(), directory)}")
         print("Press Ctrl+C to stop the server")
@@ -29,4 +200,4 @@ def serve_pwa(port=8080, directory='instaloader_pwa'):
 if __name__ == "__main__":
     import sys
     port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
-    serve_pwa(port)
\ No newline at end of file
+    serve_pwa(port)
@@ -0,0 +1,248 @@
+"""
+Disk quotas for downloaded profiles and session files.
+
+A StorageManager sweeps ./downloads and the session directory in a background
+thread. Everything stored for one profile (its directory, archive and archive
+index) is one entry; when the downloads exceed their byte quota the least
+recently used entries are deleted first. Session files are removed once they
+are older than the maximum age, and oldest-first while over their own quota.
+Entries the caller reports as busy, such as profiles still being downloaded,
+are never touched.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+
+from archive_storage import ARCHIVE_FORMATS
+
+ACCESS_LOG_NAME = '.storage_access.json'
+
+# Longest suffixes first, so "user.zip.index.json" groups under "user" and not "user.zip"
+_ENTRY_SUFFIXES = (tuple(f'.{fmt}.index.json' for fmt in ARCHIVE_FORMATS)
+                   + tuple(f'.{fmt}.{extra}' for fmt in ARCHIVE_FORMATS for extra in ('journal', 'corrupt'))
+                   + tuple(f'.{fmt}' for fmt in ARCHIVE_FORMATS))
+
+
+def entry_name_for(file_name):
+    """Name of the download entry a top-level file or directory of ./downloads belongs to"""
+    for suffix in _ENTRY_SUFFIXES:
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return file_name
+
+
+def path_size(path):
+    """Size in bytes of a file, or of every file below a directory"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Removed while walking
+    return total
+
+
+def path_mtime(path):
+    """Latest modification time of a file, or of anything below a directory"""
+    latest = os.path.getmtime(path)
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                try:
+                    latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+                except OSError:
+                    pass
+    return latest
+
+
+class StorageManager:
+    """
+    Keeps downloads and session files within their byte quotas.
+
+    Quotas of 0 or None mean unlimited. is_busy(entry_name) is asked before a
+    download entry is deleted; returning True keeps it regardless of the quota.
+    """
+
+    def __init__(self, downloads_dir='./downloads', downloads_quota=None, sessions_dir='./',
+                 sessions_quota=None, session_max_age=3600, interval=300, is_busy=None):
+        self.downloads_dir = downloads_dir
+        self.downloads_quota = downloads_quota
+        self.sessions_dir = sessions_dir
+        self.sessions_quota = sessions_quota
+        self.session_max_age = session_max_age
+        self.interval = interval
+        self.is_busy = is_busy or (lambda name: False)
+        self.access_log_path = os.path.join(downloads_dir, ACCESS_LOG_NAME)
+        self._last_access = self._load_access_log()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {
+            'last_sweep': None,
+            'sweep_seconds': None,
+            'downloads': {'bytes': 0, 'entries': 0, 'quota': downloads_quota, 'evicted': 0, 'evicted_bytes': 0,
+                          'skipped_busy': 0},
+            'sessions': {'bytes': 0, 'files': 0, 'quota': sessions_quota, 'max_age': session_max_age,
+                         'evicted': 0, 'evicted_bytes': 0},
+        }
+
+    def _load_access_log(self):
+        try:
+            with open(self.access_log_path) as f:
+                return {name: float(ts) for name, ts in json.load(f).items()}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def _save_access_log(self):
+        os.makedirs(self.downloads_dir, exist_ok=True)
+        with self._lock:
+            access_log = dict(self._last_access)
+        temp_path = f"{self.access_log_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(access_log, f)
+        os.replace(temp_path, self.access_log_path)
+
+    def touch(self, entry_name):
+        """Record that a download entry was just written or read"""
+        with self._lock:
+            self._last_access[entry_name] = time.time()
+
+    def start(self):
+        """Sweep in a daemon thread right away and then every interval seconds; later calls do nothing"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='storage-manager', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Storage sweep failed: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def sweep(self):
+        """Enforce the session and download quotas once; returns the updated usage statistics"""
+        started = time.time()
+        self.sweep_sessions()
+        self.sweep_downloads()
+        self.stats['last_sweep'] = round(started, 3)
+        self.stats['sweep_seconds'] = round(time.time() - started, 3)
+        return self.usage()
+
+    def download_entries(self):
+        """Map every download entry name to its paths, size and last access time"""
+        entries = {}
+        if not os.path.isdir(self.downloads_dir):
+            return entries
+        for file_name in os.listdir(self.downloads_dir):
+            if file_name.startswith(ACCESS_LOG_NAME):
+                continue
+            path = os.path.join(self.downloads_dir, file_name)
+            try:
+                size, mtime = path_size(path), path_mtime(path)
+            except OSError:
+                continue
+            entry = entries.setdefault(entry_name_for(file_name), {'paths': [], 'bytes': 0, 'modified': 0})
+            entry['paths'].append(path)
+            entry['bytes'] += size
+            entry['modified'] = max(entry['modified'], mtime)
+
+        with self._lock:
+            for name, entry in entries.items():
+                entry['last_access'] = max(self._last_access.get(name, 0), entry['modified'])
+            # Forget entries deleted by hand
+            for name in set(self._last_access) - set(entries):
+                del self._last_access[name]
+        return entries
+
+    def sweep_downloads(self):
+        """Delete least recently used, idle download entries until the downloads fit their quota"""
+        entries = self.download_entries()
+        total = sum(entry['bytes'] for entry in entries.values())
+        stats = self.stats['downloads']
+        stats['skipped_busy'] = 0
+
+        if self.downloads_quota and total > self.downloads_quota:
+            for name, entry in sorted(entries.items(), key=lambda item: item[1]['last_access']):
+                if total <= self.downloads_quota:
+                    break
+                if self.is_busy(name):
+                    stats['skipped_busy'] += 1
+                    continue
+                for path in entry['paths']:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                total -= entry['bytes']
+                del entries[name]
+                with self._lock:
+                    self._last_access.pop(name, None)
+                stats['evicted'] += 1
+                stats['evicted_bytes'] += entry['bytes']
+                print(f"Evicted {name} from downloads ({entry['bytes']} bytes)")
+
+        stats['bytes'] = total
+        stats['entries'] = len(entries)
+        if entries:
+            self._save_access_log()
+
+    def sweep_sessions(self):
+        """Delete expired session files, then the oldest ones while over the sessions quota"""
+        sessions = []
+        for file_name in os.listdir(self.sessions_dir):
+            if file_name.startswith("session_") and file_name.endswith(".session"):
+                path = os.path.join(self.sessions_dir, file_name)
+                try:
+                    sessions.append((os.path.getmtime(path), os.path.getsize(path), path))
+                except OSError:
+                    continue
+        sessions.sort()
+
+        now = time.time()
+        total = sum(size for _, size, _ in sessions)
+        stats = self.stats['sessions']
+        kept = 0
+        for mtime, size, path in sessions:
+            expired = self.session_max_age and now - mtime > self.session_max_age
+            over_quota = self.sessions_quota and total > self.sessions_quota
+            if not expired and not over_quota:
+                kept += 1
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                kept += 1
+                continue
+            total -= size
+            stats['evicted'] += 1
+            stats['evicted_bytes'] += size
+
+        stats['bytes'] = total
+        stats['files'] = kept
+
+    def usage(self):
+        """Usage statistics as of the last sweep"""
+        return json.loads(json.dumps(self.stats))
+
+
+def quota_from_env(name, default_mb):
+    """Read a quota in megabytes from the environment and return it in bytes (0 disables it)"""
+    return int(float(os.environ.get(name, default_mb)) * 1024 * 1024)